@@ -0,0 +1,459 @@
+import math
+import mmap
+import os
+import struct
+import time
+from array import array
+from collections.abc import Sequence
+
+from stock import Stock, CommonStock, PreferredStock
+from trade import Trade
+
+"""
+    Checkpoint and restore of a whole Exchange.
+
+    A checkpoint holds every stock's definition, the trades in its pricing window and the window totals, along with
+    the client trade IDs the exchange is remembering for de-duplication, in a compact binary format. Restoring memory maps the file and reads trades straight out of the map as they're needed, so the
+    time taken depends on the number of stocks rather than the number of trades.
+
+    Format (all little endian, every section starts on an 8 byte boundary):
+
+        header, 32 bytes
+            4s  magic, b"SSCP"
+            H   format version
+            H   length of the exchange name in bytes
+            I   number of stocks
+            4x  padding
+            Q   total number of trades
+            d   exchange clock time the checkpoint was taken
+
+        trade ID table, 16 bytes. Version 2 onwards.
+            Q   offset of the trade ID section from the start of the file
+            Q   number of trade IDs
+
+        the exchange name, utf-8, padded
+
+        one record per stock, 64 bytes each
+            4s  symbol, ascii, null padded
+            B   type, see STOCK_TYPES
+            B   flags, see QUANTITIES_ARE_INTS and PRICES_ARE_INTS
+            2x  padding
+            q   par value
+            q   last dividend
+            d   fixed dividend (0 for Common stocks)
+            Q   offset of this stock's trade block from the start of the file
+            Q   number of trades
+            d   window total of price * quantity
+            d   window total of quantity
+
+        one trade block per stock, oldest trade first, each column padded
+            d[] timestamps
+            q[] or d[] quantities, depending on flags
+            q[] or d[] prices, depending on flags
+            B[] indicators, see INDICATORS
+
+        the trade ID section, oldest first. Version 2 onwards.
+            d[] timestamps of the trades, padded
+            then one entry per ID
+                B   kind, see TRADE_ID_KINDS
+                I   length in bytes
+                ... the ID, as a utf-8 string
+"""
+
+MAGIC = b"SSCP"
+FORMAT_VERSION = 2
+READABLE_VERSIONS = (1, 2)
+
+HEADER = struct.Struct("<4sHHI4xQd")
+TRADE_ID_TABLE = struct.Struct("<QQ")
+STOCK = struct.Struct("<4sBB2xqqdQQdd")
+TRADE_ID = struct.Struct("<BI")
+
+STOCK_TYPES = {0: Stock.TYPE_COMMON, 1: Stock.TYPE_PREFERRED}
+STOCK_TYPE_CODES = {name: code for code, name in STOCK_TYPES.items()}
+
+INDICATORS = (Trade.BUY_INDICATOR, Trade.SELL_INDICATOR)
+INDICATOR_CODES = {name: code for code, name in enumerate(INDICATORS)}
+
+# stock flags
+QUANTITIES_ARE_INTS = 1
+PRICES_ARE_INTS = 2
+KNOWN_FLAGS = QUANTITIES_ARE_INTS | PRICES_ARE_INTS
+
+# trade ID kind : type the ID is restored as. Trade IDs of any other type can't be checkpointed.
+TRADE_ID_KINDS = {0: str, 1: int}
+
+
+class InvalidCheckpointException(Exception):
+    """
+        The file isn't a checkpoint, is from a version we can't read, or is truncated or corrupt.
+    """
+    pass
+
+
+def _padded(length):
+    return (length + 7) & ~7
+
+
+class MappedTrades(Sequence):
+    """
+        Trades restored from a checkpoint, used in place of a Stock's trades list.
+
+        The restored trades are read out of the checkpoint's memory map, and a Trade object is only made for one when
+        it is asked for. New trades are appended to a plain list after them.
+    """
+
+    def __init__(self, timestamps, quantities, indicators, prices):
+        """
+        :param memoryview timestamps: one column per argument, all the same length
+        :param memoryview quantities:
+        :param memoryview indicators: codes, see INDICATORS
+        :param memoryview prices:
+        """
+        self.timestamps = timestamps
+        self.quantities = quantities
+        self.indicators = indicators
+        self.prices = prices
+
+        self.mapped_count = len(timestamps)
+        self.appended = []
+
+    def __len__(self):
+        return self.mapped_count + len(self.appended)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+
+        if index >= self.mapped_count:
+            return self.appended[index - self.mapped_count]
+
+        if index < 0:
+            raise IndexError("trade index out of range")
+
+        return Trade.restore(
+            self.timestamps[index],
+            self.quantities[index],
+            INDICATORS[self.indicators[index]],
+            self.prices[index]
+        )
+
+    def append(self, trade):
+        self.appended.append(trade)
+
+    def columns(self, start, stop):
+        """
+        Columns for trades start to stop, without making Trade objects for the restored ones.
+
+        :return: timestamps, quantities, indicator codes, prices
+        :rtype tuple:
+        """
+        mapped_stop = min(stop, self.mapped_count)
+        mapped_start = min(start, mapped_stop)
+
+        columns = (
+            self.timestamps[mapped_start:mapped_stop].tolist(),
+            self.quantities[mapped_start:mapped_stop].tolist(),
+            self.indicators[mapped_start:mapped_stop].tolist(),
+            self.prices[mapped_start:mapped_stop].tolist(),
+        )
+
+        appended = self.appended[max(0, start - self.mapped_count):max(0, stop - self.mapped_count)]
+        if appended:
+            columns[0].extend(x.timestamp for x in appended)
+            columns[1].extend(x.quantity for x in appended)
+            columns[2].extend(INDICATOR_CODES[x.indicator] for x in appended)
+            columns[3].extend(x.price for x in appended)
+
+        return columns
+
+
+def _trade_columns(trades, start, stop):
+    if isinstance(trades, MappedTrades):
+        return trades.columns(start, stop)
+
+    window = trades[start:stop]
+    return (
+        [x.timestamp for x in window],
+        [x.quantity for x in window],
+        [INDICATOR_CODES[x.indicator] for x in window],
+        [x.price for x in window],
+    )
+
+
+def _number_column(values):
+    """
+    Pack a column as int64 if everything in it is an int, otherwise as double.
+
+    :return: the array, and whether it's ints
+    :rtype tuple: (array, bool)
+    """
+    try:
+        return array("q", values), True
+    except TypeError:
+        return array("d", values), False
+
+
+def _trade_id_section(arrivals):
+    """
+    Pack remembered trade IDs.
+
+    :param list arrivals: (timestamp, trade_id), oldest first
+    :rtype bytes:
+    :raises TypeError: an ID isn't a str or an int
+    """
+    entries = []
+    for _, trade_id in arrivals:
+        if isinstance(trade_id, str):
+            kind = 0
+        elif type(trade_id) is int:
+            kind = 1
+        else:
+            raise TypeError(f"Can't checkpoint trade ID {trade_id!r}, only str and int trade IDs can be saved")
+
+        encoded = str(trade_id).encode("utf-8")
+        entries.append(TRADE_ID.pack(kind, len(encoded)) + encoded)
+
+    timestamps = array("d", (x[0] for x in arrivals)).tobytes()
+    return timestamps.ljust(_padded(len(timestamps)), b"\0") + b"".join(entries)
+
+
+def _read_trade_ids(buf, path, offset, count, data_start):
+    """
+    Unpack the trade ID section written by _trade_id_section.
+
+    :return: (timestamp, trade_id), oldest first
+    :rtype list:
+    :raises InvalidCheckpointException: the section is truncated or corrupt
+    """
+    size = len(buf)
+    entry_offset = offset + _padded(8 * count)
+    if offset < data_start or offset % 8 or entry_offset > size:
+        raise InvalidCheckpointException(f"{path} is truncated or corrupt, its {count} trade IDs don't fit")
+
+    timestamps = buf[offset:offset + 8 * count].cast("d")
+
+    arrivals = []
+    for timestamp in timestamps:
+        if entry_offset + TRADE_ID.size > size:
+            raise InvalidCheckpointException(f"{path} is truncated, it ends part way through its trade IDs")
+
+        kind, length = TRADE_ID.unpack_from(buf, entry_offset)
+        entry_offset += TRADE_ID.size
+
+        if kind not in TRADE_ID_KINDS or entry_offset + length > size:
+            raise InvalidCheckpointException(f"{path} is truncated or corrupt, a trade ID has kind {kind}")
+
+        try:
+            trade_id = TRADE_ID_KINDS[kind](bytes(buf[entry_offset:entry_offset + length]).decode("utf-8"))
+        except (UnicodeDecodeError, ValueError):
+            raise InvalidCheckpointException(f"{path} is corrupt, a trade ID can't be read")
+        entry_offset += length
+
+        arrivals.append((timestamp, trade_id))
+
+    return arrivals
+
+
+def write_checkpoint(exchange, path):
+    """
+    Write a checkpoint of the exchange.
+
+    Trading is only held up while each stock's window is brought up to date and its bounds noted down. Trades are
+    never changed once recorded, so the trades themselves are read and written out afterwards while trading carries
+    on. The file is written alongside and moved into place when complete, so a crash never leaves a half written
+    checkpoint at path.
+
+    :param Exchange exchange:
+    :param str path:
+    :raises TypeError: a remembered trade ID isn't a str or an int
+    """
+    with exchange.lock:
+        clock_time = exchange.clock()
+
+        # don't save trades that have aged out but not been noticed yet
+        for stock in exchange.stocks.values():
+            if not stock.expiry_managed:
+                stock.expire_trades(clock_time)
+
+        windows = []
+        for stock in exchange.stocks.values():
+            with stock.lock:
+                windows.append((stock, stock.trades, stock.window_start, len(stock.trades), stock.window_totals))
+
+        # and the IDs of the trades still in the window, so trades redelivered after a restore aren't counted twice
+        exchange.trade_ids.expire(clock_time)
+        trade_id_arrivals = list(exchange.trade_ids.arrivals)
+
+    trade_ids = _trade_id_section(trade_id_arrivals)
+
+    name = exchange.name.encode("utf-8")
+    data_offset = HEADER.size + TRADE_ID_TABLE.size + _padded(len(name)) + STOCK.size * len(windows)
+
+    records = []
+    blocks = []
+    trade_count = 0
+
+    for stock, trades, start, stop, window_totals in windows:
+        timestamps, quantities, indicators, prices = _trade_columns(trades, start, stop)
+
+        quantities, quantities_are_ints = _number_column(quantities)
+        prices, prices_are_ints = _number_column(prices)
+        flags = (QUANTITIES_ARE_INTS if quantities_are_ints else 0) | (PRICES_ARE_INTS if prices_are_ints else 0)
+
+        block = [array("d", timestamps).tobytes(), quantities.tobytes(), prices.tobytes(), bytes(indicators)]
+        block = b"".join(x.ljust(_padded(len(x)), b"\0") for x in block)
+
+        records.append(STOCK.pack(
+            stock.symbol.encode("ascii"),
+            STOCK_TYPE_CODES[stock.type],
+            flags,
+            stock.par_value,
+            stock.last_dividend,
+            stock.fixed_dividend or 0.0,
+            data_offset,
+            len(timestamps),
+            window_totals[0],
+            window_totals[1]
+        ))
+        blocks.append(block)
+
+        data_offset += len(block)
+        trade_count += len(timestamps)
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, FORMAT_VERSION, len(name), len(windows), trade_count, clock_time))
+        f.write(TRADE_ID_TABLE.pack(data_offset, len(trade_id_arrivals)))
+        f.write(name.ljust(_padded(len(name)), b"\0"))
+        f.writelines(records)
+        f.writelines(blocks)
+        f.write(trade_ids)
+
+    os.replace(temporary_path, path)
+
+
+def read_checkpoint(path, clock=time.time):
+    """
+    Restore an exchange from a checkpoint.
+
+    The file is memory mapped and stays mapped for as long as the restored trades are in use.
+
+    :param str path:
+    :param callable clock: time source for the restored exchange
+    :rtype Exchange:
+    :raises InvalidCheckpointException: not a checkpoint, an unknown version, or truncated or corrupt
+    """
+    from exchange import Exchange
+
+    with open(path, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            raise InvalidCheckpointException(f"{path} is not a checkpoint")
+
+    buf = memoryview(mapped)
+    size = len(buf)
+
+    if size < HEADER.size:
+        raise InvalidCheckpointException(f"{path} is not a checkpoint")
+
+    magic, version, name_length, stock_count, trade_count, _ = HEADER.unpack_from(buf, 0)
+    if magic != MAGIC or version not in READABLE_VERSIONS:
+        raise InvalidCheckpointException(f"{path} is not a checkpoint of a version we can read")
+
+    name_offset = HEADER.size
+    trade_id_offset, trade_id_count = 0, 0
+    if version >= 2:
+        if size < HEADER.size + TRADE_ID_TABLE.size:
+            raise InvalidCheckpointException(f"{path} is truncated, it ends inside its header")
+
+        trade_id_offset, trade_id_count = TRADE_ID_TABLE.unpack_from(buf, HEADER.size)
+        name_offset += TRADE_ID_TABLE.size
+
+    # everything up to the first trade block has to be there before any of it is read
+    table_offset = name_offset + _padded(name_length)
+    data_start = table_offset + STOCK.size * stock_count
+    if data_start > size:
+        raise InvalidCheckpointException(f"{path} is truncated, it ends before its stock table at {data_start}")
+
+    try:
+        name = bytes(buf[name_offset:name_offset + name_length]).decode("utf-8")
+    except UnicodeDecodeError:
+        raise InvalidCheckpointException(f"{path} is corrupt, the exchange name isn't utf-8")
+
+    stocks = {}
+    restored_count = 0
+
+    for record in STOCK.iter_unpack(buf[table_offset:data_start]):
+        symbol, type_code, flags, par_value, last_dividend, fixed_dividend, data_offset, count, \
+            total_price_times_quantity, total_quantity = record
+
+        try:
+            symbol = symbol.rstrip(b"\0").decode("ascii")
+        except UnicodeDecodeError:
+            raise InvalidCheckpointException(f"{path} is corrupt, a stock symbol isn't ascii")
+
+        if symbol in stocks:
+            raise InvalidCheckpointException(f"{path} is corrupt, {symbol} is in it twice")
+
+        if type_code not in STOCK_TYPES or flags & ~KNOWN_FLAGS:
+            raise InvalidCheckpointException(f"{path} is corrupt, {symbol} has type {type_code} and flags {flags}")
+
+        column_size = _padded(8 * count)
+        block_end = data_offset + 3 * column_size + count
+        if data_offset < data_start or data_offset % 8 or block_end > size:
+            raise InvalidCheckpointException(
+                f"{path} is truncated or corrupt, {symbol}'s {count} trades at {data_offset} don't fit in {size} bytes"
+            )
+
+        if not (math.isfinite(total_price_times_quantity) and math.isfinite(total_quantity)):
+            raise InvalidCheckpointException(f"{path} is corrupt, {symbol}'s window totals aren't finite")
+
+        try:
+            if STOCK_TYPES[type_code] == Stock.TYPE_PREFERRED:
+                stock = PreferredStock(symbol, par_value, last_dividend, fixed_dividend)
+            else:
+                stock = CommonStock(symbol, par_value, last_dividend)
+        except AssertionError:
+            raise InvalidCheckpointException(f"{path} is corrupt, {symbol} isn't a valid stock")
+
+        quantity_format = "q" if flags & QUANTITIES_ARE_INTS else "d"
+        price_format = "q" if flags & PRICES_ARE_INTS else "d"
+
+        timestamps = buf[data_offset:data_offset + 8 * count].cast("d")
+        quantities = buf[data_offset + column_size:data_offset + column_size + 8 * count].cast(quantity_format)
+        prices = buf[data_offset + 2 * column_size:data_offset + 2 * column_size + 8 * count].cast(price_format)
+        indicators = buf[data_offset + 3 * column_size:block_end]
+
+        # one byte per trade, and checking them here saves a bad one turning up as an IndexError much later
+        if indicators.tobytes().translate(None, bytes(range(len(INDICATORS)))):
+            raise InvalidCheckpointException(f"{path} is corrupt, {symbol} has unknown trade indicators")
+
+        # totals are stored as doubles, put them back to ints if that's what they were summed from
+        if flags & QUANTITIES_ARE_INTS:
+            total_quantity = int(total_quantity)
+            if flags & PRICES_ARE_INTS:
+                total_price_times_quantity = int(total_price_times_quantity)
+
+        stock.restore_window(
+            MappedTrades(timestamps, quantities, indicators, prices),
+            (total_price_times_quantity, total_quantity)
+        )
+        stocks[symbol] = stock
+        restored_count += count
+
+    if restored_count != trade_count:
+        raise InvalidCheckpointException(f"{path} is corrupt, it has {restored_count} trades, not {trade_count}")
+
+    exchange = Exchange(name, stocks, clock=clock)
+
+    if trade_id_count:
+        exchange.trade_ids.restore(_read_trade_ids(buf, path, trade_id_offset, trade_id_count, data_start))
+        if len(exchange.trade_ids) != trade_id_count:
+            raise InvalidCheckpointException(f"{path} is corrupt, it has the same trade ID more than once")
+
+    return exchange
@@ -1,12 +1,18 @@
 from tabulate import tabulate
 from exchange import ExchangeBuilder, InvalidStockException
+from stock import Stock
 from trade import InvalidTradeException
+from views import METRICS
 
 """
     CLI for using this program
 """
 
 
+# Number of stocks shown per page when listing
+LIST_PAGE_SIZE = 20
+
+
 def main():
     cli = CLI()
     cli.run()
@@ -34,7 +40,10 @@ class CLI(object):
         """
         print(f"Welcome to SimpleStocks. You are trading on the {self.exchange}.")
         while True:
-            input = self._prompt_user("Enter Action: (a)ll share index, (l)ist, (b)uy, (s)ell, (q)uit")
+            input = self._prompt_user(
+                "Enter Action: (a)ll share index, (l)ist, (b)uy, (s)ell, (q)uit\n"
+                "  list options: [price|yield|pe|volume] [asc|desc] [common|preferred] [page N]"
+            )
             try:
                 self.interpret_user_action_request(input)
             except UserInterrupt:
@@ -58,8 +67,9 @@ class CLI(object):
             self._show_share_index()
             return
 
-        if input in ["list", "l"]:
-            self._show_stock_list()
+        words = input.split()
+        if words and words[0] in ["list", "l"]:
+            self._show_stock_list(words[1:])
             return
 
         if input in ["buy", "b"]:
@@ -81,30 +91,82 @@ class CLI(object):
         raw_index = self.exchange.calculate_all_share_index()
         print(f" {self.exchange.name} All Share Index: {round(raw_index, 3)}")
 
-    def _show_stock_list(self):
+    def _show_stock_list(self, options=()):
         """
-        List stocks in the terminal
+        List stocks in the terminal, optionally sorted, filtered by type and paged.
+
+        :param list options: words following the list command, see _parse_list_options
         :return:
         """
+        try:
+            metric, descending, stock_type, page = self._parse_list_options(options)
+        except ValueError as e:
+            print(str(e))
+            return
+
+        start = (page - 1) * LIST_PAGE_SIZE
+        stop = start + LIST_PAGE_SIZE
+
+        if metric:
+            stocks = self.exchange.sorted_stocks(metric, start, stop, descending=descending, stock_type=stock_type)
+        else:
+            stocks = [x for x in self.exchange.stocks.values() if not stock_type or x.type == stock_type]
+            stocks = stocks[start:stop]
 
-        print(" Stock List:")
+        print(f" Stock List (page {page}):")
 
-        headers = ["Symbol", "Type", "Last Dividend", "Fixed Dividend", "Dividend Yield", "P/E Ratio", "Price"]
+        headers = ["Symbol", "Type", "Last Dividend", "Fixed Dividend", "Dividend Yield", "P/E Ratio", "Price",
+                   "Volume"]
 
         table = []
-        for stock in self.exchange.stocks.values():
+        for stock in stocks:
             row = [stock.symbol,
                    stock.type,
                    stock.last_dividend,
                    stock.fixed_dividend or '',
                    round(stock.calculate_dividend_yield(), 3),
                    round(stock.calculate_price_to_earnings_ratio(), 3),
-                   stock.calculate_price()]
+                   stock.calculate_price(),
+                   stock.calculate_volume()]
             table.append(row)
 
         print(tabulate(table, headers=headers, tablefmt="github"))
         return
 
+    def _parse_list_options(self, options):
+        """
+        Interpret the options given to the list command, in any order:
+            price|yield|pe|volume  - sort by this (largest first unless asc is given)
+            asc|desc               - sort direction
+            common|preferred       - only show stocks of this type
+            [page] N               - which page of LIST_PAGE_SIZE stocks to show
+
+        :param list options:
+        :return: metric (or None), descending, stock type (or None), page
+        :rtype tuple: (str, bool, str, int)
+        :raises ValueError: an option wasn't understood
+        """
+        metric = None
+        descending = True
+        stock_type = None
+        page = 1
+
+        for option in options:
+            if option in METRICS:
+                metric = option
+            elif option in ["asc", "desc"]:
+                descending = option == "desc"
+            elif option in ["common", "preferred"]:
+                stock_type = Stock.TYPE_COMMON if option == "common" else Stock.TYPE_PREFERRED
+            elif option == "page":
+                continue
+            elif option.isdigit() and int(option) > 0:
+                page = int(option)
+            else:
+                raise ValueError(f"Sorry, I don't know how to list by {option}")
+
+        return metric, descending, stock_type, page
+
     def _buy_stock(self):
         """
         Prompts the user for information needed to buy a stock, confirms they want to do this and then carries out the
@@ -0,0 +1,87 @@
+from collections import deque
+
+from stock import Stock
+
+"""
+    Bounded memory de-duplication of client trade IDs.
+"""
+
+
+class TradeIdWindow(object):
+    """
+        Remembers the trade IDs seen in the last window_seconds.
+
+        IDs are held in a set for O(1) lookups, alongside a queue in arrival order so that expired IDs can be dropped
+        from the front in O(1) each. Memory is proportional to the number of trades in the window, not the number
+        ever made.
+    """
+
+    def __init__(self, window_seconds=Stock.PRICE_WINDOW_SECONDS):
+        """
+        :param float window_seconds: how long to remember an ID for. Defaults to the pricing window.
+        """
+        self.window_seconds = window_seconds
+
+        self.ids = set()
+        self.arrivals = deque()  # (timestamp, trade_id), oldest first
+
+        # counters
+        self.accepted = 0
+        self.duplicates = 0
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, trade_id):
+        return trade_id in self.ids
+
+    @property
+    def duplicate_rate(self):
+        """
+        :return: fraction of trade IDs checked which were duplicates
+        :rtype float:
+        """
+        checked = self.accepted + self.duplicates
+        return self.duplicates / checked if checked else 0.0
+
+    def expire(self, now):
+        """
+        Forget IDs older than the window. Assumes timestamps arrive in order, as they do from the Exchange clock.
+
+        :param float now:
+        """
+        cutoff = now - self.window_seconds
+        arrivals = self.arrivals
+
+        while arrivals and arrivals[0][0] < cutoff:
+            self.ids.discard(arrivals.popleft()[1])
+
+    def restore(self, arrivals):
+        """
+        Replace the remembered IDs, e.g. with those saved in a checkpoint. The counters are left alone.
+
+        :param list arrivals: (timestamp, trade_id), oldest first
+        """
+        self.arrivals = deque(arrivals)
+        self.ids = {x[1] for x in self.arrivals}
+
+    def add(self, trade_id, timestamp):
+        """
+        Remember a trade ID, unless it's already been seen within the window.
+
+        :param trade_id: any hashable ID
+        :param float timestamp: time of the trade
+        :return: True if the ID is new, False if it's a duplicate
+        :rtype bool:
+        """
+        self.expire(timestamp)
+
+        if trade_id in self.ids:
+            self.duplicates += 1
+            return False
+
+        self.ids.add(trade_id)
+        self.arrivals.append((timestamp, trade_id))
+        self.accepted += 1
+
+        return True
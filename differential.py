@@ -0,0 +1,264 @@
+import argparse
+import math
+import random
+import string
+from collections import namedtuple
+
+from exchange import Exchange, InvalidStockException
+from reference import ReferenceExchange
+from stock import CommonStock, PreferredStock
+from trade import InvalidTradeException
+
+"""
+    Randomised differential testing of an Exchange implementation against the reference oracle.
+
+    A seeded workload of buys, sells, quotes and index requests is played against both the oracle and a candidate
+    exchange under a simulated clock, and every answer is compared. The first disagreement is reported.
+
+    Run from the command line with `python differential.py --operations 1000000`.
+"""
+
+# Far enough in the past that a few million simulated seconds never reaches the real "now", which Trade refuses
+# to go beyond.
+SIMULATED_START_TIME = 1000000000
+
+# Relative tolerance for float comparisons. Optimised engines are allowed to sum in a different order.
+REL_TOLERANCE = 1e-9
+
+# Metrics compared for a stock on every quote
+STOCK_METRICS = ("calculate_price", "calculate_dividend_yield", "calculate_price_to_earnings_ratio")
+
+Divergence = namedtuple("Divergence", ["step", "operation", "metric", "expected", "actual"])
+
+
+class SimulatedClock(object):
+    """
+        Stand in for time.time which only moves when told to.
+    """
+
+    def __init__(self, start=SIMULATED_START_TIME):
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def generate_stock_specs(rng, stock_count):
+    """
+    Randomly generate stock listings. Roughly one in four is Preferred.
+
+    :param random.Random rng:
+    :param int stock_count:
+    :return: list of (type, symbol, par_value, last_dividend, fixed_dividend) tuples
+    :rtype list:
+    """
+    symbols = set()
+    while len(symbols) < stock_count:
+        symbols.add("".join(rng.choice(string.ascii_uppercase) for _ in range(3)))
+
+    specs = []
+    for symbol in sorted(symbols):
+        par_value = rng.randint(1, 500)
+        last_dividend = rng.choice([0, 0, rng.randint(1, 50)])
+
+        if rng.random() < 0.25:
+            specs.append(("Preferred", symbol, par_value, last_dividend, rng.choice([0.0, 0.02, rng.random()])))
+        else:
+            specs.append(("Common", symbol, par_value, last_dividend, None))
+
+    return specs
+
+
+def build_stocks(specs):
+    """
+    Turn the output of generate_stock_specs into real Stocks.
+
+    :param list specs:
+    :rtype dict: stock_symbol : Stock
+    """
+    stocks = {}
+    for stock_type, symbol, par_value, last_dividend, fixed_dividend in specs:
+        if stock_type == "Preferred":
+            stocks[symbol] = PreferredStock(symbol, par_value, last_dividend, fixed_dividend)
+        else:
+            stocks[symbol] = CommonStock(symbol, par_value, last_dividend)
+
+    return stocks
+
+
+def generate_workload(rng, symbols, operation_count):
+    """
+    Yields operations to play against an exchange.
+
+    The workload is split into phases of a few thousand operations. Sustained phases trade steadily with no long
+    gaps, so windows never empty and any running totals have to survive a long stream of trades coming and going.
+    Mixed phases move time in whole seconds so that trades regularly land exactly on the 900 second window boundary,
+    with the occasional long idle period so every stock drops back to par value. Each phase trades at its own price
+    scale, so large trades age out of windows still holding small ones.
+
+    :param random.Random rng:
+    :param list symbols: stock symbols to trade
+    :param int operation_count:
+    :return: generator of tuples, the first item being the operation name
+    """
+    # drawn uniformly, so repeated entries act as weights
+    mixed_gaps = [0] * 30 + [1] * 30 + [2] * 10 + [5] * 5 + [60, 899, 900, 901, 2000]
+    sustained_gaps = [0, 0, 1, 1, 2]
+
+    operations = 0
+    while operations < operation_count:
+        sustained = rng.random() < 0.5
+        gaps = sustained_gaps if sustained else mixed_gaps
+        price_scale = rng.choice([1, 1, 1, 10000, 0.001])
+
+        for _ in range(min(rng.randint(500, 5000), operation_count - operations)):
+            operations += 1
+            roll = rng.random()
+
+            if roll < 0.02 and not sustained:
+                yield ("advance", rng.choice([899, 900, 901, 1800, 5000]))
+
+            elif roll < 0.5:
+                yield ("advance", rng.choice(gaps))
+                yield (rng.choice(["buy_stock", "sell_stock"]), *_random_trade(rng, symbols, price_scale))
+
+            elif roll < 0.9:
+                yield ("advance", rng.choice(gaps))
+                yield ("quote", _random_symbol(rng, symbols))
+
+            else:
+                yield ("calculate_all_share_index",)
+
+
+def _random_symbol(rng, symbols):
+    if rng.random() < 0.01:
+        return "XXXX"  # never listed
+    return rng.choice(symbols)
+
+
+def _random_trade(rng, symbols, price_scale=1):
+    quantity = rng.randint(1, 10000)
+    price = rng.randint(1, 2000)
+
+    # a mix of whole pennies, exact binary fractions and prices floats can't represent exactly, so that summing in
+    # a different order (or subtracting) than the oracle shows up as rounding error
+    roll = rng.random()
+    if roll < 0.3:
+        price = price + rng.choice([0.25, 0.5, 0.75])
+    elif roll < 0.7:
+        price = round((price + rng.random()) * price_scale, 3)
+
+    # sprinkle in some bad trades, both sides should reject them identically
+    if rng.random() < 0.005:
+        quantity = rng.choice([0, -1])
+    if rng.random() < 0.005:
+        price = rng.choice([0, -5])
+
+    return _random_symbol(rng, symbols), quantity, price
+
+
+def _call(func, *args):
+    """
+    Run func and capture either its result or the type of exception it raised, so that both can be compared.
+    """
+    try:
+        return func(*args)
+    except (InvalidStockException, InvalidTradeException, ZeroDivisionError) as e:
+        return type(e)
+
+
+def _same(expected, actual):
+    if isinstance(expected, float) or isinstance(actual, float):
+        if isinstance(expected, (int, float)) and isinstance(actual, (int, float)):
+            return math.isclose(expected, actual, rel_tol=REL_TOLERANCE, abs_tol=1e-12)
+    return expected == actual
+
+
+def default_candidate(stocks, clock):
+    """
+    The candidate used when none is given: the current Exchange.
+    """
+    return Exchange("Candidate", stocks, clock=clock)
+
+
+def run_differential(candidate_factory=default_candidate, operation_count=100000, seed=0, stock_count=20):
+    """
+    Play a random workload against the oracle and a candidate exchange and return the first divergence.
+
+    :param callable candidate_factory: called with (dict of stock_symbol : Stock, clock), returns an exchange.
+    :param int operation_count: number of workload operations to generate
+    :param int seed: seed for the workload, the same seed always produces the same run
+    :param int stock_count: number of stocks to list
+    :return: the first divergence, or None if the two always agreed
+    :rtype Divergence:
+    """
+    rng = random.Random(seed)
+    specs = generate_stock_specs(rng, stock_count)
+    symbols = [spec[1] for spec in specs]
+
+    oracle_clock = SimulatedClock()
+    candidate_clock = SimulatedClock()
+
+    stocks = build_stocks(specs)
+    oracle = ReferenceExchange.from_stocks("Oracle", stocks, clock=oracle_clock)
+    candidate = candidate_factory(stocks, candidate_clock)
+
+    step = 0
+    for operation in generate_workload(rng, symbols, operation_count):
+        name = operation[0]
+        step += 1
+
+        if name == "advance":
+            oracle_clock.advance(operation[1])
+            candidate_clock.advance(operation[1])
+            continue
+
+        if name == "quote":
+            symbol = operation[1]
+            oracle_stock = _call(oracle.get_stock, symbol)
+            candidate_stock = _call(candidate.get_stock, symbol)
+
+            if isinstance(oracle_stock, type) or isinstance(candidate_stock, type):
+                if oracle_stock != candidate_stock:
+                    return Divergence(step, operation, "get_stock", oracle_stock, candidate_stock)
+                continue
+
+            for metric in STOCK_METRICS:
+                expected = _call(getattr(oracle_stock, metric))
+                actual = _call(getattr(candidate_stock, metric))
+                if not _same(expected, actual):
+                    return Divergence(step, operation, metric, expected, actual)
+            continue
+
+        # everything else is a call with the same name on both exchanges
+        expected = _call(getattr(oracle, name), *operation[1:])
+        actual = _call(getattr(candidate, name), *operation[1:])
+        if not _same(expected, actual):
+            return Divergence(step, operation, name, expected, actual)
+
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Differential test the Exchange against the reference oracle.")
+    parser.add_argument("--operations", type=int, default=100000, help="number of workload operations")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--stocks", type=int, default=20, help="number of stocks to list")
+    args = parser.parse_args()
+
+    divergence = run_differential(operation_count=args.operations, seed=args.seed, stock_count=args.stocks)
+
+    if divergence is None:
+        print(f"No divergence in {args.operations} operations (seed {args.seed}).")
+        return
+
+    print(f"Divergence at step {divergence.step}: {divergence.operation}")
+    print(f"  {divergence.metric}: expected {divergence.expected!r}, got {divergence.actual!r}")
+    exit(1)
+
+
+if __name__ == '__main__':
+    main()
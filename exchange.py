@@ -1,8 +1,10 @@
+import threading
 import time
 
-from trade import Trade
+from dedup import TradeIdWindow
+from trade import Trade, DuplicateTradeException
 
-from functools import reduce
+from functools import reduce, wraps
 
 
 class InvalidStockException(Exception):
@@ -12,6 +14,35 @@ class InvalidStockException(Exception):
     pass
 
 
+def recorded(method):
+    """
+    Decorator for public Exchange calls which should be captured when the Exchange is recording a workload trace (see
+    Exchange.start_recording). Only calls from clients are captured: calls the Exchange makes itself go through
+    un-decorated helpers, and anything called on this thread from inside a recorded call or a listener is skipped.
+    """
+    operation = method.__name__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        # read once, stop_recording may be clearing it on another thread
+        recorder = self.recorder
+
+        if recorder is None or getattr(self._call_state, "internal", False):
+            return method(self, *args, **kwargs)
+
+        # timestamp and write together under the lock, so a trace from several threads is still in time order
+        with self.lock:
+            recorder.record(operation, self.clock(), *args, **kwargs)
+
+        self._call_state.internal = True
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._call_state.internal = False
+
+    return wrapper
+
+
 class ExchangeBuilder(object):
 
     @staticmethod
@@ -35,17 +66,18 @@ class ExchangeBuilder(object):
         return stocks
 
     @staticmethod
-    def build():
+    def build(clock=time.time):
         """
         Creates an Exchange with some default stocks in it.
 
         In real life would do a lot more.
+        :param callable clock: time source for the exchange, see Exchange.__init__
         :return:
         :rtype Exchange:
         """
 
         stocks = ExchangeBuilder._load_stocks()
-        return Exchange("Global Beverage Corporation Exchange", stocks)
+        return Exchange("Global Beverage Corporation Exchange", stocks, clock=clock)
 
 
 class Exchange(object):
@@ -53,23 +85,51 @@ class Exchange(object):
         Represents an exchange. Holds a number of stocks which can be traded.
     """
 
-    def __init__(self, name, stocks):
+    def __init__(self, name, stocks, clock=time.time):
         """
         Initialize the Exchange. Requires a name (for the exchange) and a dictionary of Stocks which are listed on it,
         indexed by Stock.symbol
 
         :param str name:
         :param dict stocks:
+        :param callable clock: returns the current time in seconds since the epoch. Shared with the listed stocks so
+                               trade timestamps and pricing windows agree. Defaults to time.time.
         """
 
         assert isinstance(stocks, dict)
 
         self.name = name
         self.stocks = stocks
+        self.clock = clock
+
+        # Held while trades are recorded or expired, so background expiry never interleaves with a trade
+        self.lock = threading.RLock()
+
+        # Objects with a stock_changed(exchange, stock) method, told whenever a stock's metrics may have moved
+        self.listeners = []
+
+        # (metric, stock type) : views.SortedStockView, built the first time something asks to sort that way
+        self.sorted_views = {}
+
+        # expiry.ExpiryScheduler, made along with the first sorted view or by start_expiry_scheduler
+        self.expiry_scheduler = None
+
+        # client trade IDs seen recently, so redelivered trades aren't counted twice
+        self.trade_ids = TradeIdWindow()
+
+        # workload.TraceRecorder, when recording
+        self.recorder = None
+
+        # per thread, so one thread being inside a recorded call doesn't stop another's calls being recorded
+        self._call_state = threading.local()
+
+        for stock in self.stocks.values():
+            stock.clock = clock
 
     def __str__(self):
         return self.name
 
+    @recorded
     def get_stock(self, stock_symbol):
         """
         Fetches the Stock object with that stock_symbol. Throws an exception if it's not traded on this exchange.
@@ -79,6 +139,12 @@ class Exchange(object):
         :rtype Stock:
         :raises InvalidStockException: the given stock symbol isn't found.
         """
+        return self._find_stock(stock_symbol)
+
+    def _find_stock(self, stock_symbol):
+        """
+        get_stock for the Exchange's own use, so that it isn't recorded as a client call.
+        """
         picked_stock = self.stocks.get(stock_symbol)
 
         if not picked_stock:
@@ -86,6 +152,188 @@ class Exchange(object):
 
         return picked_stock
 
+    def add_listener(self, listener):
+        """
+        Register a listener to be told when a stock's price (and so its yield, P/E and the All Share Index) may have
+        changed. The listener must have a stock_changed(exchange, stock) method.
+
+        :param listener:
+        """
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """
+        Stop telling a listener about changes.
+
+        :param listener:
+        :raises ValueError: the listener was never added
+        """
+        self.listeners.remove(listener)
+
+    def _notify_stock_changed(self, stock):
+        # whatever listeners call on the Exchange isn't client traffic, so keep it out of any recording
+        internal = getattr(self._call_state, "internal", False)
+        self._call_state.internal = True
+        try:
+            for listener in self.listeners:
+                listener.stock_changed(self, stock)
+        finally:
+            self._call_state.internal = internal
+
+    def publish_quotes(self, name=None):
+        """
+        Start publishing every stock's price, dividend yield, P/E ratio and the All Share Index to a shared memory
+        quote board, which other local processes can read with quoteboard.QuoteBoardReader without talking to us.
+
+        The board is kept up to date as trades are made. Trades ageing out of a stock's pricing window only reach the
+        board when something notices them, so unless an expiry scheduler is running (see start_expiry_scheduler) a
+        stock that stops trading keeps showing the price it had when it last traded. Call stop_publishing(board) when
+        done.
+
+        :param str name: shared memory block name, generated if not given
+        :return: the board being published to. Its name attribute is what readers need.
+        :rtype quoteboard.QuoteBoard:
+        """
+        from quoteboard import QuoteBoard
+
+        # a trade between the first publish and add_listener would never reach the board
+        with self.lock:
+            board = QuoteBoard(list(self.stocks.keys()), name=name)
+            board.publish(self)
+            self.add_listener(board)
+
+        return board
+
+    def stop_publishing(self, board, unlink=True):
+        """
+        Stop updating a quote board from publish_quotes and release it.
+
+        :param quoteboard.QuoteBoard board:
+        :param bool unlink: destroy the shared memory block too. Readers already attached keep the last values.
+        """
+        with self.lock:
+            if board in self.listeners:
+                self.remove_listener(board)
+
+        board.close()
+        if unlink:
+            board.unlink()
+
+    def start_recording(self, path):
+        """
+        Capture every get_stock, get_stock_price, buy_stock, sell_stock and calculate_all_share_index call, with its
+        arguments and the time it was made, into a binary trace file which workload.replay can play back later.
+
+        :param str path: file to write the trace to. Overwritten if it exists.
+        :return: the recorder
+        :rtype workload.TraceRecorder:
+        """
+        from workload import TraceRecorder
+
+        self.stop_recording()
+        self.recorder = TraceRecorder(path)
+
+        return self.recorder
+
+    def stop_recording(self):
+        """
+        Stop capturing calls and flush the trace to disk. Does nothing if not recording.
+        """
+        recorder = self.recorder
+        self.recorder = None
+
+        if recorder is not None:
+            recorder.close()
+
+    def checkpoint(self, path):
+        """
+        Save the stocks, the trades in their pricing windows, the window totals and the trade IDs remembered for
+        de-duplication to a compact binary file. Trading is only paused for long enough to note where each window
+        starts and ends and copy the trade IDs.
+
+        :param str path: file to write. Replaced if it exists.
+        """
+        from checkpoint import write_checkpoint
+
+        write_checkpoint(self, path)
+
+    @staticmethod
+    def restore(path, clock=time.time):
+        """
+        Load an Exchange saved with checkpoint(). The file is memory mapped, so trades are only read in as needed.
+
+        :param str path:
+        :param callable clock: time source for the restored exchange, see __init__
+        :rtype Exchange:
+        :raises checkpoint.InvalidCheckpointException: the file isn't a checkpoint we can read
+        """
+        from checkpoint import read_checkpoint
+
+        return read_checkpoint(path, clock=clock)
+
+    def start_expiry_scheduler(self):
+        """
+        Expire old trades in a background thread at the moment they leave the pricing window, rather than when a price
+        is next read. Listeners are told about the price change as it happens, and reads become pure lookups.
+
+        :return: the running scheduler. Call stop() on it when done.
+        :rtype expiry.ExpiryScheduler:
+        """
+        scheduler = self._get_expiry_scheduler()
+        scheduler.start()
+
+        return scheduler
+
+    def _get_expiry_scheduler(self):
+        with self.lock:
+            if self.expiry_scheduler is None:
+                from expiry import ExpiryScheduler
+
+                self.expiry_scheduler = ExpiryScheduler(self)
+
+            return self.expiry_scheduler
+
+    def sorted_stocks(self, metric, start=0, stop=None, descending=False, stock_type=None):
+        """
+        Stocks ordered by a metric, sliced from start to stop. For example the top 20 by dividend yield is
+        sorted_stocks("yield", 0, 20, descending=True), and the top 20 Preferred stocks is the same with
+        stock_type=Stock.TYPE_PREFERRED. Each metric and type combination keeps its own view, so either costs
+        O(log n + k) for a page of k.
+
+        The ordering is kept up to date as trades are made rather than re-sorted on each call. Prices also move when
+        trades age out of the pricing window. With an expiry scheduler running (see start_expiry_scheduler) that is
+        announced as it happens, otherwise any stocks with trades due to age out are expired and moved before
+        answering.
+
+        :param str metric: "price", "yield", "pe" or "volume"
+        :param int start: first position to return
+        :param int stop: position to stop before, defaults to the end
+        :param bool descending: largest first
+        :param str stock_type: only stocks of this type, Stock.TYPE_COMMON or Stock.TYPE_PREFERRED
+        :return: list of Stocks
+        :rtype list:
+        :raises views.InvalidMetricException: unknown metric
+        """
+        # under the lock, so no trade can land between a new view's first sort and it listening for trades
+        with self.lock:
+            view = self.sorted_views.get((metric, stock_type))
+
+            if view is None:
+                from views import SortedStockView
+
+                view = SortedStockView(self, metric, stock_type)
+                self.sorted_views[(metric, stock_type)] = view
+                self.add_listener(view)
+
+            scheduler = self._get_expiry_scheduler()
+            if scheduler.thread is None:
+                scheduler.run_pending()
+
+            symbols = view.symbols(start, stop, descending)
+
+        return [self.stocks[symbol] for symbol in symbols]
+
+    @recorded
     def get_stock_price(self, stock_symbol):
         """
         Quotes the price of the requested Stock.
@@ -95,10 +343,11 @@ class Exchange(object):
         :rtype: int
         :raises InvalidStockException: if the stock symbol given is invalid.
         """
-        picked_stock = self.get_stock(stock_symbol)
+        picked_stock = self._find_stock(stock_symbol)
         return picked_stock.calculate_price()
 
-    def buy_stock(self, stock_symbol, quantity, price):
+    @recorded
+    def buy_stock(self, stock_symbol, quantity, price, trade_id=None):
         """
         Look up a stock by stock_symbol and record a Buy trade against it.
 
@@ -109,43 +358,74 @@ class Exchange(object):
         :param str stock_symbol: identifier for the stock
         :param int quantity: number of stock to buy
         :param int price: price in pennies
+        :param trade_id: optional client ID for the trade. A trade is only recorded once per ID, see _check_trade_id
         :raises InvalidStockException: wrong stock_symbol
         :raises InvalidTradeException: quantity or price are invalid
+        :raises DuplicateTradeException: a trade with this trade_id has already been recorded
         """
-        picked_stock = self.get_stock(stock_symbol)
+        picked_stock = self._find_stock(stock_symbol)
+
+        # timestamp under the lock, so trades are always recorded in time order
+        with self.lock:
+            timestamp = self.clock()
+            new_trade = Trade(
+                timestamp,
+                quantity,
+                Trade.BUY_INDICATOR,
+                price
+            )
 
-        timestamp = time.time()
-        new_trade = Trade(
-            timestamp,
-            quantity,
-            Trade.BUY_INDICATOR,
-            price
-        )
+            self._check_trade_id(trade_id, timestamp)
 
-        picked_stock.record_trade(new_trade)
+            picked_stock.record_trade(new_trade)
+            self._notify_stock_changed(picked_stock)
 
-    def sell_stock(self, stock_symbol, quantity, price):
+    @recorded
+    def sell_stock(self, stock_symbol, quantity, price, trade_id=None):
         """
         Look up a stock by stock_symbol and record a Sell trade against it.
 
         :param str stock_symbol: identifier for the stock
         :param int quantity: number of stock to sell
         :param int price: price in pennies
+        :param trade_id: optional client ID for the trade. A trade is only recorded once per ID, see _check_trade_id
         :raises InvalidStockException: wrong stock_symbol
         :raises InvalidTradeException: quantity or price are invalid
+        :raises DuplicateTradeException: a trade with this trade_id has already been recorded
+        """
+        picked_stock = self._find_stock(stock_symbol)
+
+        # timestamp under the lock, so trades are always recorded in time order
+        with self.lock:
+            timestamp = self.clock()
+            new_trade = Trade(
+                timestamp,
+                quantity,
+                Trade.SELL_INDICATOR,
+                price
+            )
+
+            self._check_trade_id(trade_id, timestamp)
+
+            picked_stock.record_trade(new_trade)
+            self._notify_stock_changed(picked_stock)
+
+    def _check_trade_id(self, trade_id, timestamp):
         """
-        picked_stock = self.get_stock(stock_symbol)
+        Make trade ingestion idempotent for feeds which deliver at least once. IDs are remembered for as long as the
+        pricing window, after which the original trade no longer affects any price anyway.
 
-        timestamp = time.time()
-        new_trade = Trade(
-            timestamp,
-            quantity,
-            Trade.SELL_INDICATOR,
-            price
-        )
+        :param trade_id: client trade ID, or None to skip the check
+        :param float timestamp: time of the trade
+        :raises DuplicateTradeException: the ID was seen within the window
+        """
+        if trade_id is None:
+            return
 
-        picked_stock.record_trade(new_trade)
+        if not self.trade_ids.add(trade_id, timestamp):
+            raise DuplicateTradeException(f"Trade {trade_id} has already been recorded!")
 
+    @recorded
     def calculate_all_share_index(self):
         """
         Calculates the all share index value in pennies.
@@ -156,7 +436,12 @@ class Exchange(object):
         :return:
         :rtype: float - not rounded.
         """
+        return self._calculate_all_share_index()
 
+    def _calculate_all_share_index(self):
+        """
+        calculate_all_share_index for the Exchange's own use, so that it isn't recorded as a client call.
+        """
         if len(self.stocks) < 1:
             return 0
 
@@ -0,0 +1,143 @@
+import heapq
+import threading
+
+"""
+    Background expiry of trades from the pricing window.
+"""
+
+
+class ExpiryScheduler(object):
+    """
+        Expires trades from each stock's pricing window at the moment they age out, instead of leaving it to whichever
+        read comes next.
+
+        Keeps a heap of (next expiry time, stock symbol) with one entry per stock that has trades in its window. New
+        trades never expire before a stock's oldest one, so an entry only needs adding when a stock's window goes
+        from empty to not. Stocks with nothing in their window cost nothing until they trade again.
+
+        When trades expire the stock's listeners are told through the Exchange, just as for a trade, so the quote
+        board, sorted views and the All Share Index they publish all move at that moment.
+    """
+
+    def __init__(self, exchange):
+        """
+        Nothing runs in the background until start() is called, and until then reads still expire their own stock's
+        trades. run_pending() can be called directly instead, to tell listeners about trades that have aged out.
+
+        :param Exchange exchange:
+        """
+        self.exchange = exchange
+        self.condition = threading.Condition(exchange.lock)
+        self.thread = None
+        self.running = False
+
+        self.heap = []  # (expiry time, stock symbol)
+        self.scheduled = set()  # stock symbols with an entry in the heap
+
+        with self.condition:
+            for stock in exchange.stocks.values():
+                self._expire_stock(stock, exchange.clock())
+
+            exchange.add_listener(self)
+
+    def _schedule(self, stock):
+        expiry_time = stock.next_expiry()
+
+        if expiry_time is None:
+            return
+
+        heapq.heappush(self.heap, (expiry_time, stock.symbol))
+        self.scheduled.add(stock.symbol)
+
+    def _expire_stock(self, stock, now, due=False):
+        # a due stock is always announced, as a read may have expired its trades already without telling anyone
+        changed = stock.expire_trades(now)
+        self._schedule(stock)
+
+        if changed or due:
+            self.exchange._notify_stock_changed(stock)
+
+    def stock_changed(self, exchange, stock):
+        """
+        Exchange listener callback. Make sure a stock that just traded has an expiry scheduled.
+
+        :param Exchange exchange:
+        :param Stock stock:
+        """
+        if stock.symbol in self.scheduled:
+            return
+
+        self._schedule(stock)
+        self.condition.notify()
+
+    def run_pending(self):
+        """
+        Expire trades from every stock whose next expiry has passed.
+
+        :return: number of stocks whose window changed since they were last scheduled
+        :rtype int:
+        """
+        with self.condition:
+            now = self.exchange.clock()
+            expired = 0
+
+            while self.heap and self.heap[0][0] < now:
+                _, symbol = heapq.heappop(self.heap)
+                self.scheduled.discard(symbol)
+
+                stock = self.exchange.stocks[symbol]
+                self._expire_stock(stock, now, due=True)
+                expired += 1
+
+            return expired
+
+    def seconds_until_next_expiry(self):
+        """
+        :return: seconds until the next trade expires, or None if there are no trades in any window
+        :rtype float:
+        """
+        if not self.heap:
+            return None
+
+        return max(0.0, self.heap[0][0] - self.exchange.clock())
+
+    def _run(self):
+        with self.condition:
+            while self.running:
+                self.run_pending()
+                self.condition.wait(self.seconds_until_next_expiry())
+
+    def start(self):
+        """
+        Start expiring trades in a background daemon thread, and take over expiry from the stocks' reads.
+        """
+        if self.thread is not None:
+            return
+
+        with self.condition:
+            for stock in self.exchange.stocks.values():
+                stock.expiry_managed = True
+
+            # catch up on anything reads left unannounced before they stopped expiring trades
+            self.run_pending()
+
+        self.running = True
+        self.thread = threading.Thread(target=self._run, name="ExpiryScheduler", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the background thread and hand expiry back to the stocks' reads. The scheduler stays listening for trades,
+        so run_pending() still works afterwards.
+        """
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        with self.condition:
+            for stock in self.exchange.stocks.values():
+                stock.expiry_managed = False
@@ -0,0 +1,301 @@
+import math
+import struct
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+"""
+    Shared memory quote board.
+
+    The Exchange can publish its current quotes into a block of shared memory (see Exchange.publish_quotes), which any
+    number of local processes can then read without any IPC round trips or load on the trading process.
+
+    Layout (all little endian):
+
+        header, 32 bytes
+            4s  magic, b"SSQB"
+            H   layout version
+            H   size of one stock record
+            I   number of stock records
+            4x  padding
+            Q   sequence number (see below)
+            d   All Share Index
+
+        one record per stock, 32 bytes each, in a fixed order set when the board is created
+            4s  stock symbol, ascii, null padded
+            4x  padding
+            d   price
+            d   dividend yield
+            d   P/E ratio
+
+    Consistency is handled with a seqlock. The writer bumps the sequence number to an odd value before writing and
+    back to an even value when done. A reader copies the block, and only trusts the copy if the sequence number was
+    even and unchanged either side of it.
+"""
+
+MAGIC = b"SSQB"
+LAYOUT_VERSION = 1
+
+HEADER = struct.Struct("<4sHHI4xQd")
+SEQUENCE = struct.Struct("<Q")
+SEQUENCE_OFFSET = 16
+INDEX = struct.Struct("<d")
+INDEX_OFFSET = 24
+
+RECORD = struct.Struct("<4s4xddd")
+METRICS = struct.Struct("<ddd")
+METRICS_OFFSET = 8  # within a record
+
+Quote = namedtuple("Quote", ["symbol", "price", "dividend_yield", "price_to_earnings_ratio"])
+QuoteSnapshot = namedtuple("QuoteSnapshot", ["sequence", "all_share_index", "quotes"])
+
+
+class InvalidQuoteBoardException(Exception):
+    """
+        The shared memory block isn't a quote board we understand.
+    """
+    pass
+
+
+class QuoteBoardBusyException(Exception):
+    """
+        A reader gave up waiting for the writer to finish an update.
+    """
+    pass
+
+
+class QuoteBoard(object):
+    """
+        Writer side of the quote board. Owned by the process holding the Exchange, and registered with it as a
+        listener so it is updated after every trade.
+
+        The All Share Index is kept as a running sum of the log of every stock's last published price, so a trade only
+        costs working out the stock that traded rather than every stock on the exchange. The sum is re-added from the
+        published prices once every len(symbols) updates so float error can't build up in it.
+    """
+
+    def __init__(self, symbols, name=None):
+        """
+        Create the shared memory block and lay out a record for each stock.
+
+        :param list symbols: symbols of the stocks to publish. Fixed for the life of the board.
+        :param str name: shared memory block name, generated if not given
+        """
+        self.symbols = list(symbols)
+        self.slots = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+        size = HEADER.size + RECORD.size * len(self.symbols)
+        self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+        self.name = self.shm.name
+        self.sequence = 0
+
+        self.prices = {}  # symbol : last published price
+        self.log_price_total = 0.0  # sum of log(price) over the prices above zero
+        self.zero_prices = 0  # number of prices at zero, which take the index to zero
+        self.updates_since_resum = 0
+
+        HEADER.pack_into(self.shm.buf, 0, MAGIC, LAYOUT_VERSION, RECORD.size, len(self.symbols), 0, 0.0)
+        for symbol, slot in self.slots.items():
+            RECORD.pack_into(self.shm.buf, self._record_offset(slot), symbol.encode("ascii"), 0.0, 0.0, 0.0)
+
+    @staticmethod
+    def _record_offset(slot):
+        return HEADER.size + RECORD.size * slot
+
+    def _begin_write(self):
+        self.sequence += 1
+        SEQUENCE.pack_into(self.shm.buf, SEQUENCE_OFFSET, self.sequence)
+
+    def _end_write(self):
+        self.sequence += 1
+        SEQUENCE.pack_into(self.shm.buf, SEQUENCE_OFFSET, self.sequence)
+
+    @staticmethod
+    def _quote(stock):
+        return (
+            stock.calculate_price(),
+            stock.calculate_dividend_yield(),
+            stock.calculate_price_to_earnings_ratio()
+        )
+
+    def _write_quote(self, symbol, quote):
+        METRICS.pack_into(self.shm.buf, self._record_offset(self.slots[symbol]) + METRICS_OFFSET, *quote)
+
+    def _add_price(self, price):
+        if price > 0:
+            self.log_price_total += math.log(price)
+        else:
+            self.zero_prices += 1
+
+    def _remove_price(self, price):
+        if price > 0:
+            self.log_price_total -= math.log(price)
+        else:
+            self.zero_prices -= 1
+
+    def _resum(self):
+        self.log_price_total = 0.0
+        self.zero_prices = 0
+        self.updates_since_resum = 0
+
+        for price in self.prices.values():
+            self._add_price(price)
+
+    def _set_price(self, symbol, price):
+        previous = self.prices.get(symbol)
+        self.prices[symbol] = price
+
+        self.updates_since_resum += 1
+        if self.updates_since_resum >= len(self.symbols):
+            self._resum()
+            return
+
+        if previous is not None:
+            self._remove_price(previous)
+        self._add_price(price)
+
+    def _all_share_index(self):
+        """
+        Geometric mean of the published prices, as Exchange.calculate_all_share_index.
+        """
+        if not self.prices or self.zero_prices:
+            return 0
+
+        return math.exp(self.log_price_total / len(self.prices))
+
+    def publish(self, exchange):
+        """
+        Write every stock and the All Share Index in one update.
+
+        :param Exchange exchange:
+        """
+        # work everything out before taking the "lock", so readers are held off for as short a time as possible
+        quotes = [(symbol, self._quote(exchange.stocks[symbol])) for symbol in self.symbols]
+
+        self.prices = {symbol: quote[0] for symbol, quote in quotes}
+        self._resum()
+
+        # a full update works the index out directly, exactly as the Exchange does
+        all_share_index = 0
+        if self.prices:
+            all_share_index = math.prod(self.prices.values()) ** (1 / len(self.prices))
+
+        self._begin_write()
+        try:
+            for symbol, quote in quotes:
+                self._write_quote(symbol, quote)
+            INDEX.pack_into(self.shm.buf, INDEX_OFFSET, all_share_index)
+        finally:
+            self._end_write()
+
+    def stock_changed(self, exchange, stock):
+        """
+        Exchange listener callback. Rewrites the changed stock and moves the All Share Index by its change in price,
+        without looking at any other stock.
+
+        :param Exchange exchange:
+        :param Stock stock:
+        """
+        quote = self._quote(stock)
+
+        self._set_price(stock.symbol, quote[0])
+        all_share_index = self._all_share_index()
+
+        self._begin_write()
+        try:
+            self._write_quote(stock.symbol, quote)
+            INDEX.pack_into(self.shm.buf, INDEX_OFFSET, all_share_index)
+        finally:
+            self._end_write()
+
+    def close(self):
+        """
+        Detach from the shared memory block. Use Exchange.stop_publishing, which also stops the Exchange telling this
+        board about trades.
+        """
+        self.shm.close()
+
+    def unlink(self):
+        """
+        Destroy the shared memory block. Readers that are already attached can carry on reading the last values.
+        """
+        self.shm.unlink()
+
+
+class QuoteBoardReader(object):
+    """
+        Reader side of the quote board. Attach by name from any local process.
+    """
+
+    def __init__(self, name, max_attempts=100000):
+        """
+        :param str name: the QuoteBoard's name
+        :param int max_attempts: how many times snapshot() retries a torn read before giving up
+        :raises InvalidQuoteBoardException: the block isn't a quote board of a layout we know
+        """
+        self.shm = _attach(name)
+        self.max_attempts = max_attempts
+
+        magic, version, record_size, count, _, _ = HEADER.unpack_from(self.shm.buf, 0)
+        if magic != MAGIC or version != LAYOUT_VERSION or record_size != RECORD.size:
+            self.shm.close()
+            raise InvalidQuoteBoardException(f"{name} is not a version {LAYOUT_VERSION} quote board")
+
+        self.size = HEADER.size + RECORD.size * count
+        self.count = count
+
+    def snapshot(self):
+        """
+        Take a consistent copy of every quote and the All Share Index.
+
+        :rtype QuoteSnapshot:
+        :raises QuoteBoardBusyException: couldn't get a clean read in max_attempts tries
+        """
+        buf = self.shm.buf
+
+        for _ in range(self.max_attempts):
+            before = SEQUENCE.unpack_from(buf, SEQUENCE_OFFSET)[0]
+            if before & 1:
+                continue  # writer is mid update
+
+            data = bytes(buf[:self.size])
+
+            after = SEQUENCE.unpack_from(buf, SEQUENCE_OFFSET)[0]
+            if before == after:
+                return self._parse(before, data)
+
+        raise QuoteBoardBusyException("Quote board was being written to for too long")
+
+    def _parse(self, sequence, data):
+        all_share_index = INDEX.unpack_from(data, INDEX_OFFSET)[0]
+
+        quotes = {}
+        for symbol, price, dividend_yield, pe_ratio in RECORD.iter_unpack(data[HEADER.size:]):
+            symbol = symbol.rstrip(b"\0").decode("ascii")
+            quotes[symbol] = Quote(symbol, price, dividend_yield, pe_ratio)
+
+        return QuoteSnapshot(sequence, all_share_index, quotes)
+
+    def close(self):
+        """
+        Detach from the shared memory block. Use Exchange.stop_publishing, which also stops the Exchange telling this
+        board about trades.
+        """
+        self.shm.close()
+
+
+def _attach(name):
+    """
+    Attach to an existing block without handing it to the resource tracker, which would otherwise destroy the
+    writer's block when this (reading) process exits.
+    """
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # python < 3.13 has no track argument, so stop it registering for the duration instead
+        from multiprocessing import resource_tracker
+
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name=name)
+        finally:
+            resource_tracker.register = register
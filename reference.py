@@ -0,0 +1,191 @@
+import time
+from abc import ABC, abstractclassmethod
+from functools import reduce
+
+from exchange import InvalidStockException
+from trade import Trade
+
+"""
+    Reference oracle for the Exchange.
+
+    This is a frozen copy of the original, deliberately naive Stock and Exchange logic. It exists only so that faster
+    implementations can be checked against it (see differential.py). Do NOT optimise anything in here - the whole
+    point is that it stays obviously correct:
+
+      * price is the volume weighted average of trades in the last 900 seconds, found by scanning backwards
+      * a trade exactly 900 seconds old is still in the window (the cutoff test is a strict <)
+      * with no trades in the window the price falls back to par value
+      * common yield = last dividend / price, preferred yield = fixed dividend * par value / price
+      * the All Share Index is the geometric mean of every stock price, or 0 with no stocks
+"""
+
+
+class ReferenceStock(ABC):
+    """
+    Oracle version of stock.Stock. Holds trades in a plain list and recalculates everything on every call.
+    """
+
+    TYPE_PREFERRED = "Preferred"
+    TYPE_COMMON = "Common"
+
+    def __init__(self, symbol, par_value, last_dividend, clock=time.time):
+        self.symbol = symbol.upper()
+        self.par_value = par_value
+        self.last_dividend = last_dividend
+        self.fixed_dividend = None
+        self.trades = []
+        self.clock = clock
+
+    def record_trade(self, trade):
+        """
+        Record a trade on this Stock.
+
+        :param Trade trade:
+        :raises TypeError: did not receive a Trade object.
+        """
+        if not isinstance(trade, Trade):
+            raise TypeError("Can only record Trade objects!")
+
+        self.trades.append(trade)
+
+    def calculate_price(self):
+        """
+        Volume weighted price of all trades in the last 15 minutes, or par value if there are none.
+
+        :return: Price in Pence
+        :rtype int:
+        """
+        ts_fifteen_minutes_ago = self.clock() - 900
+
+        total_price_times_quantity = 0
+        total_quantity = 0
+
+        for trade in reversed(self.trades):
+            if trade.timestamp < ts_fifteen_minutes_ago:
+                break
+
+            total_price_times_quantity += trade.price * trade.quantity
+            total_quantity += trade.quantity
+
+        if total_quantity > 0:
+            return total_price_times_quantity / total_quantity
+
+        else:
+            return self.par_value
+
+    def calculate_price_to_earnings_ratio(self):
+        """
+        Stock price / last dividend, or 0.0 if there is no dividend.
+
+        :rtype float:
+        """
+        if self.last_dividend > 0:
+            return self.calculate_price() / self.last_dividend
+
+        else:
+            return 0.0
+
+    @abstractclassmethod
+    def calculate_dividend_yield(self):
+        """
+        Implemented by child classes.
+        """
+        pass
+
+
+class ReferenceCommonStock(ReferenceStock):
+    type = ReferenceStock.TYPE_COMMON
+
+    def calculate_dividend_yield(self):
+        """
+        Last dividend / stock price
+        """
+        return self.last_dividend / self.calculate_price()
+
+
+class ReferencePreferredStock(ReferenceStock):
+    type = ReferenceStock.TYPE_PREFERRED
+
+    def __init__(self, symbol, par_value, last_dividend, fixed_dividend_percent, clock=time.time):
+        super(ReferencePreferredStock, self).__init__(symbol, par_value, last_dividend, clock=clock)
+
+        self.fixed_dividend = fixed_dividend_percent
+
+    def calculate_dividend_yield(self):
+        """
+        Fixed dividend * par_value / stock price
+        """
+        return (self.fixed_dividend * self.par_value) / self.calculate_price()
+
+
+class ReferenceExchange(object):
+    """
+    Oracle version of exchange.Exchange. Exposes the same public calls so that the two can be driven side by side.
+    """
+
+    def __init__(self, name, stocks, clock=time.time):
+        """
+        :param str name:
+        :param dict stocks: stock_symbol : ReferenceStock
+        :param callable clock: time source shared with the stocks
+        """
+        self.name = name
+        self.stocks = stocks
+        self.clock = clock
+
+        for stock in self.stocks.values():
+            stock.clock = clock
+
+    @staticmethod
+    def from_stocks(name, stocks, clock=time.time):
+        """
+        Build an oracle with the same listings as a dict of real Stocks. Trades are not copied.
+
+        :param str name:
+        :param dict stocks: stock_symbol : stock.Stock
+        :param callable clock:
+        :rtype ReferenceExchange:
+        """
+        reference_stocks = {}
+        for symbol, stock in stocks.items():
+            if stock.type == ReferenceStock.TYPE_PREFERRED:
+                reference_stocks[symbol] = ReferencePreferredStock(
+                    stock.symbol, stock.par_value, stock.last_dividend, stock.fixed_dividend
+                )
+            else:
+                reference_stocks[symbol] = ReferenceCommonStock(stock.symbol, stock.par_value, stock.last_dividend)
+
+        return ReferenceExchange(name, reference_stocks, clock=clock)
+
+    def get_stock(self, stock_symbol):
+        picked_stock = self.stocks.get(stock_symbol)
+
+        if not picked_stock:
+            raise InvalidStockException(f"Stock '{stock_symbol}' is not traded on this exchange!")
+
+        return picked_stock
+
+    def get_stock_price(self, stock_symbol):
+        return self.get_stock(stock_symbol).calculate_price()
+
+    def buy_stock(self, stock_symbol, quantity, price):
+        picked_stock = self.get_stock(stock_symbol)
+        picked_stock.record_trade(Trade(self.clock(), quantity, Trade.BUY_INDICATOR, price))
+
+    def sell_stock(self, stock_symbol, quantity, price):
+        picked_stock = self.get_stock(stock_symbol)
+        picked_stock.record_trade(Trade(self.clock(), quantity, Trade.SELL_INDICATOR, price))
+
+    def calculate_all_share_index(self):
+        """
+        Geometric mean of all stock prices, 0 if nothing is listed.
+
+        :rtype: float - not rounded.
+        """
+        if len(self.stocks) < 1:
+            return 0
+
+        stock_prices = [x.calculate_price() for x in self.stocks.values()]
+        stock_price_product = reduce(lambda x, y: x * y, stock_prices)
+
+        return stock_price_product ** (1 / len(self.stocks))
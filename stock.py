@@ -1,3 +1,4 @@
+import threading
 import time
 from abc import ABC, abstractclassmethod
 
@@ -12,6 +13,15 @@ class Stock(ABC):
     TYPE_PREFERRED = "Preferred"
     TYPE_COMMON = "Common"
 
+    # Trades older than this many seconds no longer count towards the price
+    PRICE_WINDOW_SECONDS = 900
+
+    # Float window totals are re-added from scratch once they fall below 1/RESUM_RATIO of the largest they've been,
+    # or once more trades have come and gone than are in the window (plus RESUM_SLACK). Subtracting large values
+    # leaves rounding error behind that would otherwise be big relative to what's left.
+    RESUM_RATIO = 64
+    RESUM_SLACK = 64
+
     def __init__(self, symbol, par_value, last_dividend):
 
         assert len(symbol) < 4
@@ -22,8 +32,43 @@ class Stock(ABC):
         self.par_value = par_value
         self.last_dividend = last_dividend
         self.fixed_dividend = None
+
+        # Held while the trades or window change. Reads expire old trades themselves unless a scheduler does it for
+        # them, so they can be changing the window at the same time as another thread records a trade.
+        self.lock = threading.Lock()
+
         self.trades = []
 
+        # Source of "now" for the pricing window. Swapped out by the Exchange, or by tests/benchmarks that need a
+        # simulated clock.
+        self.clock = time.time
+
+        # Set when an expiry.ExpiryScheduler evicts old trades for us, so reads don't have to
+        self.expiry_managed = False
+
+    @property
+    def trades(self):
+        """
+        Every trade recorded, oldest first. Trades from window_start onwards are in the pricing window.
+        """
+        return self._trades
+
+    @trades.setter
+    def trades(self, trades):
+        with self.lock:
+            self._trades = trades
+
+            # (sum of price * quantity, sum of quantity) over the trades in the window, kept as one tuple so that
+            # readers never see one total updated without the other
+            self._set_window(0, (sum(x.price * x.quantity for x in trades), sum(x.quantity for x in trades)))
+
+    def _set_window(self, window_start, window_totals):
+        # Call with the lock held. The totals are exact at this point, so start tracking error from here.
+        self.window_start = window_start
+        self.window_totals = window_totals
+        self.window_peaks = tuple(abs(x) for x in window_totals)
+        self.window_changes = 0
+
     @abstractclassmethod
     def calculate_dividend_yield(self):
         """
@@ -44,30 +89,119 @@ class Stock(ABC):
         if not isinstance(trade, Trade):
             raise TypeError("Can only record Trade objects!")
 
-        self.trades.append(trade)
+        with self.lock:
+            self._trades.append(trade)
+
+            total_price_times_quantity, total_quantity = self.window_totals
+            self.window_totals = (total_price_times_quantity + trade.price * trade.quantity,
+                                  total_quantity + trade.quantity)
+
+            peak_price_times_quantity, peak_quantity = self.window_peaks
+            self.window_peaks = (max(peak_price_times_quantity, abs(self.window_totals[0])),
+                                 max(peak_quantity, abs(self.window_totals[1])))
+            self.window_changes += 1
+
+    def restore_window(self, trades, window_totals):
+        """
+        Replace the trades with a window whose totals are already known, e.g. from a checkpoint, without re-adding
+        them up.
+
+        :param trades: sequence of Trades, oldest first, all in the window
+        :param tuple window_totals: (sum of price * quantity, sum of quantity) over trades
+        """
+        with self.lock:
+            self._trades = trades
+            self._set_window(0, window_totals)
+
+    def expire_trades(self, now=None):
+        """
+        Drop trades which have aged out of the pricing window from the window totals. Trades stay in self.trades.
+
+        Assumes trades were recorded in time order, as they are by the Exchange.
+
+        :param float now: defaults to the stock's clock
+        :return: True if any trades expired
+        :rtype bool:
+        """
+        if now is None:
+            now = self.clock()
+
+        ts_fifteen_minutes_ago = now - self.PRICE_WINDOW_SECONDS
+
+        with self.lock:
+            trades = self._trades
+            first = self.window_start
+            i = first
+            total_price_times_quantity, total_quantity = self.window_totals
+
+            while i < len(trades):
+                trade = trades[i]
+                if trade.timestamp >= ts_fifteen_minutes_ago:
+                    break
+
+                total_price_times_quantity -= trade.price * trade.quantity
+                total_quantity -= trade.quantity
+                i += 1
+
+            if i == first:
+                return False
+
+            if i == len(trades):
+                # start from exactly zero again, rather than whatever float error the subtractions left behind
+                self._set_window(i, (0, 0))
+
+            elif self._needs_resum(total_price_times_quantity, total_quantity, len(trades) - i, i - first):
+                window = trades[i:]
+                self._set_window(i, (sum(x.price * x.quantity for x in window), sum(x.quantity for x in window)))
+
+            else:
+                self.window_start = i
+                self.window_totals = (total_price_times_quantity, total_quantity)
+                self.window_changes += i - first
+
+        return True
+
+    def _needs_resum(self, total_price_times_quantity, total_quantity, window_size, expired):
+        """
+        Whether float totals have drifted far enough from exact to be re-added. Int totals are always exact.
+        """
+        if not (isinstance(total_price_times_quantity, float) or isinstance(total_quantity, float)):
+            return False
+
+        peak_price_times_quantity, peak_quantity = self.window_peaks
+
+        return (abs(total_price_times_quantity) * self.RESUM_RATIO < peak_price_times_quantity
+                or abs(total_quantity) * self.RESUM_RATIO < peak_quantity
+                or self.window_changes + expired > window_size + self.RESUM_SLACK)
+
+    def next_expiry(self):
+        """
+        When the oldest trade in the window will age out of it. It is dropped as soon as the time is past this.
+
+        :return: timestamp, or None if there are no trades in the window
+        :rtype float:
+        """
+        with self.lock:
+            if self.window_start >= len(self._trades):
+                return None
+
+            return self._trades[self.window_start].timestamp + self.PRICE_WINDOW_SECONDS
 
     def calculate_price(self):
         """
         Calculate the stock price in pence from the sum of the price * quantity, divided by the quantity of all trades
         in the last 15 minutes.
 
-        In a live system you'd probably want to rate-limit this.
+        The totals are kept up to date as trades are recorded and expire, so unless an ExpiryScheduler is managing
+        this stock the only work here is dropping any trades that have aged out since the last call.
 
         :return: Price in Pence
         :rtype int:
         """
-        ts_fifteen_minutes_ago = time.time() - 900
-
-        total_price_times_quantity = 0
-        total_quantity = 0
-
-        for trade in reversed(self.trades):
-            # Loop through the trades list in reverse until we get to trades older than 15 minutes ago
-            if trade.timestamp < ts_fifteen_minutes_ago:
-                break
+        if not self.expiry_managed:
+            self.expire_trades()
 
-            total_price_times_quantity += trade.price * trade.quantity
-            total_quantity += trade.quantity
+        total_price_times_quantity, total_quantity = self.window_totals
 
         if total_quantity > 0:
             return total_price_times_quantity / total_quantity
@@ -75,6 +209,18 @@ class Stock(ABC):
         else:  # No recent trades, return par value just as a sensible default
             return self.par_value
 
+    def calculate_volume(self):
+        """
+        Calculate the number of shares traded in the last 15 minutes, i.e. over the same trades as calculate_price.
+
+        :return: number of shares
+        :rtype int:
+        """
+        if not self.expiry_managed:
+            self.expire_trades()
+
+        return self.window_totals[1]
+
     def calculate_price_to_earnings_ratio(self):
         """
         Calculate the price to earnings ratio. This is the stock price / dividend.
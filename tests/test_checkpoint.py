@@ -0,0 +1,159 @@
+import os
+import struct
+import tempfile
+import unittest
+
+from checkpoint import HEADER, MAGIC, TRADE_ID_TABLE, InvalidCheckpointException, MappedTrades
+from differential import SimulatedClock
+from exchange import Exchange, ExchangeBuilder
+from trade import DuplicateTradeException, Trade
+
+
+class test_checkpoint(unittest.TestCase):
+    """
+    Test saving an Exchange to a checkpoint and restoring it
+    """
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".ckpt")
+        os.close(handle)
+
+        self.clock = SimulatedClock()
+        self.exchange = ExchangeBuilder.build(clock=self.clock)
+
+        self.exchange.buy_stock("TEA", 100, 200)
+        self.clock.advance(1000)
+        self.exchange.buy_stock("TEA", 100, 150)
+        self.clock.advance(10)
+        self.exchange.sell_stock("TEA", 300, 100)
+        self.exchange.sell_stock("GIN", 5, 99.5)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def restore(self):
+        self.exchange.checkpoint(self.path)
+        return Exchange.restore(self.path, clock=self.clock)
+
+    def test_round_trip(self):
+        restored = self.restore()
+
+        self.assertEqual(restored.name, self.exchange.name)
+        self.assertEqual(set(restored.stocks), set(self.exchange.stocks))
+
+        for symbol, stock in self.exchange.stocks.items():
+            restored_stock = restored.get_stock(symbol)
+
+            self.assertEqual(restored_stock.type, stock.type)
+            self.assertEqual(restored_stock.par_value, stock.par_value)
+            self.assertEqual(restored_stock.last_dividend, stock.last_dividend)
+            self.assertEqual(restored_stock.fixed_dividend, stock.fixed_dividend)
+            self.assertEqual(restored_stock.calculate_price(), stock.calculate_price())
+            self.assertEqual(restored_stock.calculate_volume(), stock.calculate_volume())
+
+        self.assertEqual(restored.calculate_all_share_index(), self.exchange.calculate_all_share_index())
+
+    def test_only_window_is_kept(self):
+        # the first TEA trade has expired, so isn't saved
+        self.exchange.get_stock_price("TEA")
+        restored = self.restore()
+
+        trades = restored.get_stock("TEA").trades
+        self.assertIsInstance(trades, MappedTrades)
+        self.assertEqual([(x.quantity, x.indicator, x.price) for x in trades],
+                         [(100, Trade.BUY_INDICATOR, 150), (300, Trade.SELL_INDICATOR, 100)])
+        self.assertEqual(restored.get_stock("GIN").trades[-1].price, 99.5)
+
+    def test_trading_after_restore(self):
+        restored = self.restore()
+
+        self.clock.advance(5)
+        restored.buy_stock("TEA", 400, 300)
+        self.assertEqual(len(restored.get_stock("TEA").trades), 3)
+        self.assertEqual(restored.get_stock_price("TEA"), 206.25)  # (100*150 + 300*100 + 400*300) / 800
+
+        # restored trades still age out of the window
+        self.clock.advance(897)
+        self.assertEqual(restored.get_stock_price("TEA"), 300)
+
+        # and a restored exchange can be checkpointed again
+        restored.checkpoint(self.path)
+        self.assertEqual(Exchange.restore(self.path, clock=self.clock).get_stock_price("TEA"), 300)
+
+    def test_trade_ids_restored(self):
+        # a feed redelivering trades across a restart must not have them counted twice
+        self.exchange.buy_stock("TEA", 10, 100, trade_id="A")
+        self.exchange.sell_stock("GIN", 10, 100, trade_id=42)
+        restored = self.restore()
+
+        self.assertRaises(DuplicateTradeException, restored.buy_stock, "TEA", 10, 100, trade_id="A")
+        self.assertRaises(DuplicateTradeException, restored.sell_stock, "GIN", 10, 100, trade_id=42)
+        restored.buy_stock("TEA", 10, 100, trade_id="42")  # IDs keep their type
+
+        # and are forgotten when the window moves past them, as before
+        self.clock.advance(901)
+        restored.buy_stock("TEA", 10, 100, trade_id="A")
+
+    def test_unsupported_trade_id(self):
+        self.exchange.buy_stock("TEA", 10, 100, trade_id=("feed", 1))
+        self.assertRaises(TypeError, self.exchange.checkpoint, self.path)
+
+    def test_version_1_still_readable(self):
+        name = b"OLD"
+        with open(self.path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, 1, len(name), 0, 0, 0.0) + name.ljust(8, b"\0"))
+
+        restored = Exchange.restore(self.path)
+        self.assertEqual(restored.name, "OLD")
+        self.assertEqual(len(restored.trade_ids), 0)
+
+    def test_trade_ids_past_end(self):
+        self.exchange.buy_stock("TEA", 10, 100, trade_id="A")
+        self.corrupt(HEADER.size + 8, "<Q", 1000)
+        self.assertRaises(InvalidCheckpointException, Exchange.restore, self.path)
+
+    def test_not_a_checkpoint(self):
+        with open(self.path, "wb") as f:
+            f.write(b"hello world")
+
+        self.assertRaises(InvalidCheckpointException, Exchange.restore, self.path)
+
+    def corrupt(self, offset, value_format, value):
+        """
+        Checkpoint, then overwrite part of the file.
+        """
+        self.exchange.checkpoint(self.path)
+
+        with open(self.path, "r+b") as f:
+            f.seek(offset)
+            f.write(struct.pack(value_format, value))
+
+    def table_offset(self):
+        name_length = len(self.exchange.name.encode("utf-8"))
+        return HEADER.size + TRADE_ID_TABLE.size + (name_length + 7) // 8 * 8
+
+    def test_truncated(self):
+        self.exchange.checkpoint(self.path)
+        size = os.path.getsize(self.path)
+
+        for length in (size - 1, HEADER.size + 40, HEADER.size):
+            with open(self.path, "r+b") as f:
+                f.truncate(length)
+            self.assertRaises(InvalidCheckpointException, Exchange.restore, self.path)
+
+    def test_too_many_stocks(self):
+        self.corrupt(8, "<I", 1000000)
+        self.assertRaises(InvalidCheckpointException, Exchange.restore, self.path)
+
+    def test_bad_type_code(self):
+        self.corrupt(self.table_offset() + 4, "<B", 7)
+        self.assertRaises(InvalidCheckpointException, Exchange.restore, self.path)
+
+    def test_trade_count_past_end(self):
+        # the columns would come up short of the count
+        self.corrupt(self.table_offset() + 40, "<Q", 1000)
+        self.assertRaises(InvalidCheckpointException, Exchange.restore, self.path)
+
+    def test_data_offset_past_end(self):
+        self.corrupt(self.table_offset() + 32, "<Q", 1 << 40)
+        self.assertRaises(InvalidCheckpointException, Exchange.restore, self.path)
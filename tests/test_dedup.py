@@ -0,0 +1,72 @@
+import unittest
+
+from dedup import TradeIdWindow
+from differential import SimulatedClock
+from exchange import ExchangeBuilder
+from trade import DuplicateTradeException, InvalidTradeException
+
+
+class test_trade_id_window(unittest.TestCase):
+    """
+    Test the bounded trade ID de-duplication
+    """
+
+    def test_duplicate_rejected(self):
+        window = TradeIdWindow(900)
+
+        self.assertTrue(window.add("A", 0))
+        self.assertTrue(window.add("B", 1))
+        self.assertFalse(window.add("A", 2))
+
+        self.assertEqual(window.accepted, 2)
+        self.assertEqual(window.duplicates, 1)
+        self.assertAlmostEqual(window.duplicate_rate, 1 / 3)
+
+    def test_ids_expire_with_window(self):
+        # same boundary as the pricing window: exactly window_seconds old is still remembered
+        window = TradeIdWindow(900)
+        window.add("A", 0)
+
+        self.assertFalse(window.add("A", 900))
+
+        window.expire(901)
+        self.assertEqual(len(window), 0)
+        self.assertTrue(window.add("A", 901))
+
+    def test_memory_bounded(self):
+        window = TradeIdWindow(10)
+        for i in range(1000):
+            window.add(i, i)
+
+        self.assertEqual(len(window), 11)
+        self.assertEqual(len(window.arrivals), 11)
+
+
+class test_exchange_trade_ids(unittest.TestCase):
+    """
+    Test that the Exchange only records a trade once per ID
+    """
+
+    def setUp(self):
+        self.clock = SimulatedClock()
+        self.exchange = ExchangeBuilder.build(clock=self.clock)
+
+    def test_redelivered_trade_not_double_counted(self):
+        self.exchange.buy_stock("TEA", 100, 200, trade_id="X1")
+        self.clock.advance(5)
+        self.assertRaises(DuplicateTradeException, self.exchange.buy_stock, "TEA", 100, 200, trade_id="X1")
+        self.exchange.sell_stock("TEA", 100, 100, trade_id="X2")
+
+        self.assertEqual(len(self.exchange.get_stock("TEA").trades), 2)
+        self.assertEqual(self.exchange.get_stock_price("TEA"), 150)
+        self.assertEqual(self.exchange.trade_ids.duplicates, 1)
+
+    def test_invalid_trade_does_not_use_up_id(self):
+        self.assertRaises(InvalidTradeException, self.exchange.buy_stock, "TEA", 0, 200, trade_id="X1")
+        self.exchange.buy_stock("TEA", 10, 200, trade_id="X1")
+
+    def test_no_trade_id(self):
+        self.exchange.buy_stock("TEA", 100, 200)
+        self.exchange.buy_stock("TEA", 100, 200)
+
+        self.assertEqual(len(self.exchange.get_stock("TEA").trades), 2)
@@ -0,0 +1,85 @@
+import unittest
+
+from differential import SimulatedClock, run_differential
+from exchange import Exchange
+from reference import ReferenceCommonStock, ReferencePreferredStock
+from trade import Trade
+
+
+class OffByOneStock(object):
+    """
+    Wraps a real Stock, but treats a trade exactly on the window boundary as expired.
+    """
+
+    def __init__(self, stock):
+        self.stock = stock
+
+    def __getattr__(self, item):
+        return getattr(self.stock, item)
+
+    def calculate_price(self):
+        cutoff = self.stock.clock() - 900
+        recent = [t for t in self.stock.trades if t.timestamp > cutoff]
+        if not recent:
+            return self.stock.par_value
+        return sum(t.price * t.quantity for t in recent) / sum(t.quantity for t in recent)
+
+
+class test_reference(unittest.TestCase):
+    """
+    Sanity check the oracle itself against the documented semantics
+    """
+
+    def setUp(self):
+        self.clock = SimulatedClock()
+
+    def test_par_value_fallback(self):
+        stock = ReferenceCommonStock("ABC", 120, 6, clock=self.clock)
+        self.assertEqual(stock.calculate_price(), 120)
+        self.assertEqual(stock.calculate_dividend_yield(), 0.05)
+
+    def test_window_boundary_is_inclusive(self):
+        stock = ReferenceCommonStock("ABC", 120, 6, clock=self.clock)
+        stock.record_trade(Trade(self.clock(), 10, Trade.BUY_INDICATOR, 200))
+
+        self.clock.advance(900)
+        self.assertEqual(stock.calculate_price(), 200)
+
+        self.clock.advance(1)
+        self.assertEqual(stock.calculate_price(), 120)
+
+    def test_preferred_yield(self):
+        stock = ReferencePreferredStock("ABC", 100, 8, 0.02, clock=self.clock)
+        stock.record_trade(Trade(self.clock(), 10, Trade.BUY_INDICATOR, 50))
+        self.assertEqual(stock.calculate_dividend_yield(), 0.04)
+
+
+class test_differential(unittest.TestCase):
+    """
+    Make sure the harness passes the current Exchange and catches a broken one
+    """
+
+    def test_current_exchange_matches_oracle(self):
+        self.assertIsNone(run_differential(operation_count=20000, seed=1, stock_count=5))
+
+    def test_catches_boundary_bug_deterministically(self):
+        def broken(stocks, clock):
+            exchange = Exchange("Broken", stocks, clock=clock)
+            exchange.stocks = {symbol: OffByOneStock(stock) for symbol, stock in stocks.items()}
+            return exchange
+
+        first = run_differential(broken, operation_count=20000, seed=3, stock_count=2)
+        second = run_differential(broken, operation_count=20000, seed=3, stock_count=2)
+
+        self.assertIsNotNone(first)
+        self.assertEqual(first, second)
+
+    def test_catches_float_drift(self):
+        # running totals that are never re-added drift away from the oracle once big trades leave the window
+        def drifting(stocks, clock):
+            for stock in stocks.values():
+                stock.RESUM_RATIO = float("inf")
+                stock.RESUM_SLACK = float("inf")
+            return Exchange("Drifting", stocks, clock=clock)
+
+        self.assertIsNotNone(run_differential(drifting, operation_count=30000, seed=0, stock_count=5))
@@ -0,0 +1,122 @@
+import time
+import unittest
+
+from differential import SimulatedClock, run_differential
+from exchange import Exchange, ExchangeBuilder
+from expiry import ExpiryScheduler
+
+
+class RecordingListener(object):
+
+    def __init__(self):
+        self.changed = []
+
+    def stock_changed(self, exchange, stock):
+        self.changed.append(stock.symbol)
+
+
+class test_expiry_scheduler(unittest.TestCase):
+    """
+    Test expiring trades from pricing windows ahead of reads
+    """
+
+    def setUp(self):
+        self.clock = SimulatedClock()
+        self.exchange = ExchangeBuilder.build(clock=self.clock)
+        self.scheduler = ExpiryScheduler(self.exchange)
+
+        self.listener = RecordingListener()
+        self.exchange.add_listener(self.listener)
+
+    def test_only_trading_stocks_scheduled(self):
+        self.assertEqual(self.scheduler.heap, [])
+
+        self.exchange.buy_stock("TEA", 10, 200)
+        self.exchange.buy_stock("TEA", 10, 300)
+
+        self.assertEqual(self.scheduler.heap, [(self.clock.now + 900, "TEA")])
+
+    def test_expiry_at_boundary(self):
+        self.exchange.buy_stock("TEA", 10, 200)
+        self.clock.advance(10)
+        self.exchange.buy_stock("TEA", 10, 300)
+        self.listener.changed = []
+
+        # exactly 900 seconds old is still in the window
+        self.clock.advance(890)
+        self.assertEqual(self.scheduler.run_pending(), 0)
+        self.assertEqual(self.exchange.get_stock_price("TEA"), 250)
+
+        self.clock.advance(1)
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.listener.changed, ["TEA"])
+        self.assertEqual(self.exchange.get_stock_price("TEA"), 300)
+
+        self.clock.advance(10)
+        self.scheduler.run_pending()
+        self.assertEqual(self.exchange.get_stock_price("TEA"), 100)  # back to par
+        self.assertEqual(self.scheduler.heap, [])
+
+    def test_reads_do_not_expire(self):
+        self.scheduler.start()
+        self.exchange.buy_stock("TEA", 10, 200)
+        self.clock.advance(1000)
+
+        # the scheduler hasn't run since, so the read is a pure lookup of the old totals
+        self.assertEqual(self.exchange.get_stock_price("TEA"), 200)
+
+        self.scheduler.stop()
+        self.assertEqual(self.exchange.get_stock_price("TEA"), 100)
+
+    def test_announces_expiry_a_read_got_to_first(self):
+        self.exchange.buy_stock("TEA", 10, 200)
+        self.listener.changed = []
+        self.clock.advance(1000)
+
+        # not started, so the read expires the trade itself, but listeners still need to hear about it
+        self.assertEqual(self.exchange.get_stock_price("TEA"), 100)
+        self.assertEqual(self.scheduler.run_pending(), 1)
+        self.assertEqual(self.listener.changed, ["TEA"])
+
+    def test_matches_oracle(self):
+        def factory(stocks, clock):
+            exchange = Exchange("Candidate", stocks, clock=clock)
+            scheduler = ExpiryScheduler(exchange)
+
+            advance = clock.advance
+
+            def advance_and_expire(seconds):
+                advance(seconds)
+                scheduler.run_pending()
+
+            clock.advance = advance_and_expire
+            return exchange
+
+        self.assertIsNone(run_differential(factory, operation_count=20000, seed=11, stock_count=5))
+
+
+class test_expiry_thread(unittest.TestCase):
+    """
+    Test the scheduler's background thread with real time
+    """
+
+    def test_background_expiry(self):
+        exchange = ExchangeBuilder.build()
+        stock = exchange.get_stock("TEA")
+        stock.PRICE_WINDOW_SECONDS = 0.05
+
+        listener = RecordingListener()
+        exchange.add_listener(listener)
+        scheduler = exchange.start_expiry_scheduler()
+
+        try:
+            exchange.buy_stock("TEA", 10, 500)
+
+            deadline = time.time() + 5
+            while listener.changed.count("TEA") < 2 and time.time() < deadline:
+                time.sleep(0.01)
+
+            self.assertEqual(listener.changed, ["TEA", "TEA"])
+            self.assertEqual(stock.window_totals, (0, 0))
+        finally:
+            scheduler.stop()
@@ -0,0 +1,97 @@
+import multiprocessing
+import unittest
+
+from exchange import Exchange
+from quoteboard import QuoteBoardReader, QuoteBoardBusyException, SEQUENCE, SEQUENCE_OFFSET
+from stock import CommonStock, PreferredStock
+
+
+def read_price_in_child(name, symbol, queue):
+    reader = QuoteBoardReader(name)
+    queue.put(reader.snapshot().quotes[symbol].price)
+    reader.close()
+
+
+class test_quoteboard(unittest.TestCase):
+    """
+    Test publishing the Exchange's quotes to shared memory and reading them back
+    """
+
+    def setUp(self):
+        stocks = {
+            "TEA": CommonStock("TEA", 100, 5),
+            "GIN": PreferredStock("GIN", 100, 8, 0.02),
+        }
+        self.exchange = Exchange("TESTEX", stocks)
+        self.board = self.exchange.publish_quotes()
+        self.reader = QuoteBoardReader(self.board.name)
+
+    def tearDown(self):
+        self.reader.close()
+        self.exchange.stop_publishing(self.board)
+
+    def test_initial_quotes(self):
+        # nothing traded yet, so everything is at par
+        snapshot = self.reader.snapshot()
+
+        self.assertEqual(set(snapshot.quotes), {"TEA", "GIN"})
+        self.assertEqual(snapshot.quotes["TEA"].price, 100)
+        self.assertEqual(snapshot.quotes["TEA"].dividend_yield, 0.05)
+        self.assertEqual(snapshot.quotes["GIN"].dividend_yield, 0.02)
+        self.assertEqual(snapshot.all_share_index, 100)
+
+    def test_updated_after_trade(self):
+        before = self.reader.snapshot()
+        self.exchange.buy_stock("TEA", 10, 400)
+        after = self.reader.snapshot()
+
+        self.assertGreater(after.sequence, before.sequence)
+        self.assertEqual(after.quotes["TEA"].price, 400)
+        self.assertEqual(after.quotes["TEA"].price_to_earnings_ratio, 80)
+        self.assertAlmostEqual(after.all_share_index, self.exchange.calculate_all_share_index())
+
+    def test_trade_only_reprices_that_stock(self):
+        # the index should move with the stock that traded, without working out every other price again
+        gin = self.exchange.stocks["GIN"]
+        calls = []
+        gin.calculate_price = lambda: calls.append(1) or 100
+
+        self.exchange.buy_stock("TEA", 10, 400)
+
+        self.assertEqual(calls, [])
+        self.assertAlmostEqual(self.reader.snapshot().all_share_index, 200)
+
+    def test_index_follows_many_trades(self):
+        for i in range(1000):
+            self.exchange.buy_stock("TEA", 1 + i % 7, 50 + i % 300)
+            self.exchange.sell_stock("GIN", 1 + i % 5, 0.25 + i % 90)
+
+        self.assertAlmostEqual(self.reader.snapshot().all_share_index, self.exchange.calculate_all_share_index())
+
+    def test_trading_after_stop_publishing(self):
+        # a board that's been released must not fail trades, which are booked before listeners are told
+        board = self.exchange.publish_quotes()
+        self.exchange.stop_publishing(board)
+
+        self.exchange.buy_stock("TEA", 10, 100, trade_id="A")
+
+        self.assertEqual(len(self.exchange.stocks["TEA"].trades), 1)
+        self.assertNotIn(board, self.exchange.listeners)
+        self.assertEqual(self.reader.snapshot().quotes["TEA"].price, 100)
+
+    def test_torn_read_is_not_returned(self):
+        # edge case: pretend the writer died mid update, readers should give up rather than return junk
+        SEQUENCE.pack_into(self.board.shm.buf, SEQUENCE_OFFSET, 7)
+        self.reader.max_attempts = 10
+
+        self.assertRaises(QuoteBoardBusyException, self.reader.snapshot)
+
+    def test_read_from_other_process(self):
+        self.exchange.sell_stock("GIN", 10, 250)
+
+        queue = multiprocessing.Queue()
+        child = multiprocessing.Process(target=read_price_in_child, args=(self.board.name, "GIN", queue))
+        child.start()
+        child.join()
+
+        self.assertEqual(queue.get(timeout=5), 250)
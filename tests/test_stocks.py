@@ -1,7 +1,12 @@
+import sys
+import threading
 import unittest
 import time
 from unittest import mock
 
+from differential import SimulatedClock
+from reference import ReferenceCommonStock
+
 from stock import Stock, CommonStock, PreferredStock
 from trade import Trade
 
@@ -142,5 +147,66 @@ class TestPreferredStock(unittest.TestCase, StockTests):
             self.assertEqual(self.stock_f_dividend_5.calculate_dividend_yield(), 0.05)
 
 
+class TestConcurrentReads(unittest.TestCase):
+
+    def test_reads_while_trading_keep_totals_consistent(self):
+        # reads expire old trades themselves, which mustn't lose the totals of trades being recorded at the same time
+        clock = SimulatedClock()
+        stock = CommonStock("TE0", 100, 0)
+        stock.clock = clock
+        stock.PRICE_WINDOW_SECONDS = 50
+
+        done = threading.Event()
+
+        def read():
+            while not done.is_set():
+                stock.calculate_price()
+
+        readers = [threading.Thread(target=read) for _ in range(3)]
+        for reader in readers:
+            reader.start()
+
+        # switch threads as often as possible, so a race would actually show up
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            for i in range(5000):
+                stock.record_trade(Trade(clock(), 1 + i % 7, Trade.BUY_INDICATOR, 100 + i % 13))
+                clock.advance(1)
+        finally:
+            sys.setswitchinterval(switch_interval)
+            done.set()
+            for reader in readers:
+                reader.join()
+
+        window = stock.trades[stock.window_start:]
+        self.assertEqual(stock.window_totals,
+                         (sum(x.price * x.quantity for x in window), sum(x.quantity for x in window)))
+
+
+class TestWindowPrecision(unittest.TestCase):
+
+    def test_large_trades_leaving_window(self):
+        # edge case: huge float trades leaving the window mustn't leave rounding error behind in the small ones
+        clock = SimulatedClock()
+        stock = CommonStock("TE0", 100, 0)
+        stock.clock = clock
+        reference = ReferenceCommonStock("TE0", 100, 0, clock=clock)
+
+        for i in range(1000):
+            trade = Trade(clock(), 1 + i % 97, Trade.BUY_INDICATOR, 1e7 + i / 7)
+            stock.record_trade(trade)
+            reference.record_trade(trade)
+
+        clock.advance(500)
+        for i in range(1000):
+            trade = Trade(clock(), 1 + i % 89, Trade.BUY_INDICATOR, 0.1 + i / 70000)
+            stock.record_trade(trade)
+            reference.record_trade(trade)
+
+        clock.advance(401)
+        self.assertAlmostEqual(stock.calculate_price() / reference.calculate_price(), 1, places=12)
+
+
 if __name__ == '__main__':
     unittest.main()
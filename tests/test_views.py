@@ -0,0 +1,95 @@
+import threading
+import unittest
+
+from differential import SimulatedClock
+from exchange import Exchange
+from stock import CommonStock, PreferredStock, Stock
+from views import InvalidMetricException, SortedStockView
+
+
+class test_sorted_views(unittest.TestCase):
+    """
+    Test the incrementally maintained sorted views on the Exchange
+    """
+
+    def setUp(self):
+        # par values 100, 200, 300 so the initial price order is known
+        self.stocks = {
+            "AAA": CommonStock("AAA", 100, 10),
+            "BBB": CommonStock("BBB", 200, 10),
+            "CCC": PreferredStock("CCC", 300, 10, 0.5),
+        }
+        self.exchange = Exchange("TESTEX", self.stocks)
+
+    def symbols(self, *args, **kwargs):
+        return [x.symbol for x in self.exchange.sorted_stocks(*args, **kwargs)]
+
+    def test_sorted_by_price(self):
+        self.assertEqual(self.symbols("price"), ["AAA", "BBB", "CCC"])
+        self.assertEqual(self.symbols("price", descending=True), ["CCC", "BBB", "AAA"])
+
+    def test_top_n_and_pages(self):
+        self.assertEqual(self.symbols("price", 0, 2, descending=True), ["CCC", "BBB"])
+        self.assertEqual(self.symbols("price", 2, 4, descending=True), ["AAA"])
+        self.assertEqual(self.symbols("price", 1, 2), ["BBB"])
+        self.assertEqual(self.symbols("price", 5, 10), [])
+
+    def test_trade_moves_stock(self):
+        self.symbols("price")  # build the view before trading
+        self.exchange.buy_stock("AAA", 10, 1000)
+
+        self.assertEqual(self.symbols("price"), ["BBB", "CCC", "AAA"])
+        self.assertEqual(self.symbols("volume", 0, 1, descending=True), ["AAA"])
+
+    def test_trade_ageing_out_moves_stock_back(self):
+        clock = SimulatedClock()
+        self.exchange = Exchange("TESTEX", self.stocks, clock=clock)
+
+        self.symbols("price")
+        self.exchange.buy_stock("AAA", 10, 1000)
+        clock.advance(1000)
+
+        # the read expires AAA's trade itself, the view still has to notice
+        self.assertEqual(self.exchange.get_stock_price("AAA"), 100)
+        self.assertEqual(self.symbols("price"), ["AAA", "BBB", "CCC"])
+
+    def test_trade_while_view_is_built(self):
+        # a trade from another thread just after the first sort must still reach the view
+        refresh = SortedStockView.refresh
+        traders = []
+
+        def refresh_then_trade(view, exchange):
+            refresh(view, exchange)
+            if not traders:
+                traders.append(threading.Thread(target=exchange.buy_stock, args=("AAA", 10, 1000)))
+                traders[0].start()
+                traders[0].join(0.2)
+
+        SortedStockView.refresh = refresh_then_trade
+        try:
+            self.symbols("price")
+        finally:
+            SortedStockView.refresh = refresh
+        traders[0].join()
+
+        self.assertEqual(self.symbols("price"), ["BBB", "CCC", "AAA"])
+
+    def test_yield_order_matches_full_sort(self):
+        self.symbols("yield")
+        self.exchange.sell_stock("CCC", 5, 20)
+        self.exchange.buy_stock("BBB", 5, 15)
+
+        expected = sorted(self.stocks.values(), key=lambda x: x.calculate_dividend_yield())
+        self.assertEqual(self.symbols("yield"), [x.symbol for x in expected])
+
+    def test_filtered_by_type(self):
+        self.assertEqual(self.symbols("price", stock_type=Stock.TYPE_COMMON), ["AAA", "BBB"])
+
+        self.exchange.buy_stock("AAA", 10, 1000)
+        self.exchange.buy_stock("CCC", 10, 1)
+
+        self.assertEqual(self.symbols("price", 0, 1, descending=True, stock_type=Stock.TYPE_COMMON), ["AAA"])
+        self.assertEqual(self.symbols("price", stock_type=Stock.TYPE_PREFERRED), ["CCC"])
+
+    def test_unknown_metric(self):
+        self.assertRaises(InvalidMetricException, self.exchange.sorted_stocks, "colour")
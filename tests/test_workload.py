@@ -0,0 +1,191 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+from differential import SimulatedClock
+from exchange import ExchangeBuilder, InvalidStockException
+from workload import InvalidTraceException, TraceRecord, read_trace, replay
+
+
+class test_workload(unittest.TestCase):
+    """
+    Test recording an Exchange's calls to a trace and replaying them
+    """
+
+    def setUp(self):
+        handle, self.path = tempfile.mkstemp(suffix=".trace")
+        os.close(handle)
+
+        self.clock = SimulatedClock()
+        self.exchange = ExchangeBuilder.build(clock=self.clock)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def record_some_calls(self):
+        self.exchange.start_recording(self.path)
+
+        self.exchange.buy_stock("TEA", 100, 150)
+        self.clock.advance(10)
+        self.exchange.sell_stock("TEA", 50, 120.5, trade_id="T1")
+        self.assertRaises(InvalidStockException, self.exchange.get_stock_price, "NOPE")
+        self.clock.advance(1000)
+        self.exchange.get_stock_price("TEA")
+        self.exchange.calculate_all_share_index()
+
+        self.exchange.stop_recording()
+
+    def test_trace_round_trip(self):
+        self.record_some_calls()
+        start = self.clock.now - 1010
+
+        self.assertEqual(list(read_trace(self.path)), [
+            TraceRecord("buy_stock", start, "TEA", 100, 150, None),
+            TraceRecord("sell_stock", start + 10, "TEA", 50, 120.5, "T1"),
+            TraceRecord("get_stock_price", start + 10, "NOPE", 0, 0, None),
+            TraceRecord("get_stock_price", start + 1010, "TEA", 0, 0, None),
+            TraceRecord("calculate_all_share_index", start + 1010, "", 0, 0, None),
+        ])
+
+    def test_nested_calls_not_recorded(self):
+        # buy_stock looks the stock up internally, that shouldn't show up as its own get_stock call
+        self.exchange.start_recording(self.path)
+        self.exchange.buy_stock("TEA", 100, 150)
+        self.exchange.stop_recording()
+
+        self.assertEqual([x.operation for x in read_trace(self.path)], ["buy_stock"])
+
+    def test_internal_calls_not_recorded(self):
+        # publishing quotes and listeners look at stocks and the index, but they aren't client calls
+        self.exchange.start_recording(self.path)
+        board = self.exchange.publish_quotes()
+        try:
+            self.exchange.buy_stock("TEA", 100, 150)
+        finally:
+            self.exchange.stop_publishing(board)
+        self.exchange.stop_recording()
+
+        self.assertEqual([x.operation for x in read_trace(self.path)], ["buy_stock"])
+
+    def test_other_threads_recorded_during_a_call(self):
+        # while one thread is stuck in a slow listener, another thread's calls must still be recorded
+        in_listener = threading.Event()
+        release = threading.Event()
+
+        class SlowListener(object):
+            def stock_changed(self, exchange, stock):
+                in_listener.set()
+                release.wait(5)
+
+        self.exchange.add_listener(SlowListener())
+        self.exchange.start_recording(self.path)
+
+        trader = threading.Thread(target=self.exchange.buy_stock, args=("TEA", 100, 150))
+        trader.start()
+        in_listener.wait(5)
+
+        self.exchange.get_stock_price("POP")
+        self.exchange.calculate_all_share_index()
+
+        release.set()
+        trader.join()
+        self.exchange.stop_recording()
+
+        self.assertEqual([x.operation for x in read_trace(self.path)],
+                         ["buy_stock", "get_stock_price", "calculate_all_share_index"])
+
+    def test_stop_recording_while_calls_are_made(self):
+        # calls racing with stop_recording must never fail because the trace is closing
+        errors = []
+        stop = threading.Event()
+
+        def trade():
+            while not stop.is_set():
+                try:
+                    self.exchange.buy_stock("TEA", 1, 100)
+                except Exception as e:
+                    errors.append(e)
+
+        traders = [threading.Thread(target=trade) for _ in range(4)]
+        for trader in traders:
+            trader.start()
+
+        for _ in range(50):
+            self.exchange.start_recording(self.path)
+            self.exchange.stop_recording()
+
+        stop.set()
+        for trader in traders:
+            trader.join()
+
+        self.assertEqual(errors, [])
+
+    def test_unencodable_calls_behave_as_unrecorded(self):
+        recorder = self.exchange.start_recording(self.path)
+
+        self.assertRaises(TypeError, self.exchange.buy_stock, "TEA", "10", 100)
+        self.assertRaises(TypeError, self.exchange.buy_stock, "TEA", 10, None)
+        self.exchange.buy_stock("TEA", 10, 100)
+        self.exchange.stop_recording()
+
+        self.assertEqual(recorder.skipped, 2)
+        self.assertEqual([(x.operation, x.quantity) for x in read_trace(self.path)], [("buy_stock", 10)])
+
+    def test_trace_in_time_order_across_threads(self):
+        # replay feeds trades to stocks in trace order, which has to be time order
+        ticks = iter(range(10 ** 9))
+        exchange = ExchangeBuilder.build(clock=lambda: next(ticks))
+        exchange.start_recording(self.path)
+
+        def trade():
+            for _ in range(2000):
+                exchange.buy_stock("TEA", 1, 100)
+
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            traders = [threading.Thread(target=trade) for _ in range(4)]
+            for trader in traders:
+                trader.start()
+            for trader in traders:
+                trader.join()
+        finally:
+            sys.setswitchinterval(interval)
+
+        exchange.stop_recording()
+
+        timestamps = [x.timestamp for x in read_trace(self.path)]
+        self.assertEqual(len(timestamps), 8000)
+        self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_replay(self):
+        self.record_some_calls()
+
+        replayed = []
+
+        def factory(clock):
+            exchange = ExchangeBuilder.build(clock=clock)
+            replayed.append(exchange)
+            return exchange
+
+        report = replay(self.path, exchange_factory=factory)
+
+        self.assertEqual(report.operations, 5)
+        self.assertEqual(report.errors, 1)
+        self.assertEqual(len(report.latencies["get_stock_price"]), 2)
+        self.assertGreater(report.throughput, 0)
+
+        # the trades are replayed with their recorded timestamps
+        trades = replayed[0].get_stock("TEA").trades
+        self.assertEqual([x.timestamp for x in trades], [self.clock.now - 1010, self.clock.now - 1000])
+
+    def test_empty_file(self):
+        self.assertRaises(InvalidTraceException, list, read_trace(self.path))
+
+    def test_not_a_trace(self):
+        with open(self.path, "wb") as f:
+            f.write(b"hello world")
+
+        self.assertRaises(InvalidTraceException, list, read_trace(self.path))
@@ -6,6 +6,13 @@ class InvalidTradeException(Exception):
     pass
 
 
+class DuplicateTradeException(InvalidTradeException):
+    """
+        A trade with the same client trade ID has already been recorded.
+    """
+    pass
+
+
 class Trade(object):
     """
     Represents a trade (buy/sell) of any arbitrary stock. Would want to foreign key this to a stock if there was a DB
@@ -32,3 +39,19 @@ class Trade(object):
         self.quantity = quantity
         self.indicator = indicator
         self.price = price
+
+    @classmethod
+    def restore(cls, timestamp, quantity, indicator, price):
+        """
+        Rebuild a Trade that was validated when it was first made, e.g. when loading a checkpoint. Skips validation,
+        which would otherwise reject it for being in the future of a restored clock, and is much faster.
+
+        :rtype Trade:
+        """
+        trade = cls.__new__(cls)
+        trade.timestamp = timestamp
+        trade.quantity = quantity
+        trade.indicator = indicator
+        trade.price = price
+
+        return trade
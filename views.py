@@ -0,0 +1,110 @@
+from bisect import bisect_left, insort
+
+"""
+    Sorted views of the stocks on an Exchange, kept up to date incrementally as trades come in.
+"""
+
+# metric name : Stock method that calculates it
+METRICS = {
+    "price": "calculate_price",
+    "yield": "calculate_dividend_yield",
+    "pe": "calculate_price_to_earnings_ratio",
+    "volume": "calculate_volume",
+}
+
+
+class InvalidMetricException(Exception):
+    """
+        Asked to sort by something we don't know how to sort by.
+    """
+    pass
+
+
+class SortedStockView(object):
+    """
+        Stock symbols ordered by one metric, ascending, ties broken by symbol. Optionally only stocks of one type, so
+        a filtered page is as cheap as an unfiltered one.
+
+        Registered as a listener on the Exchange so that only the stock which traded is re-sorted. Finding a position
+        is a binary search, so a page of k stocks costs O(log n + k). Moving a stock shifts the list behind it, which
+        is a memmove and cheap next to working out the metric itself for any realistic number of listings.
+    """
+
+    def __init__(self, exchange, metric, stock_type=None):
+        """
+        :param Exchange exchange:
+        :param str metric: one of METRICS
+        :param str stock_type: Stock.TYPE_COMMON or Stock.TYPE_PREFERRED to only hold stocks of that type, or None
+                               for every stock
+        :raises InvalidMetricException: unknown metric
+        """
+        if metric not in METRICS:
+            raise InvalidMetricException(f"Can't sort by {metric}. Must be one of {', '.join(METRICS)}")
+
+        self.metric = metric
+        self.method_name = METRICS[metric]
+        self.stock_type = stock_type
+
+        self.keys = []  # sorted list of (value, symbol)
+        self.values = {}  # symbol : value currently in self.keys
+
+        self.refresh(exchange)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def refresh(self, exchange):
+        """
+        Recalculate the metric for every stock and re-sort from scratch.
+
+        :param Exchange exchange:
+        """
+        self.values = {
+            symbol: getattr(stock, self.method_name)()
+            for symbol, stock in exchange.stocks.items()
+            if self.stock_type is None or stock.type == self.stock_type
+        }
+        self.keys = sorted((value, symbol) for symbol, value in self.values.items())
+
+    def stock_changed(self, exchange, stock):
+        """
+        Exchange listener callback. Move the stock to its new position.
+
+        :param Exchange exchange:
+        :param Stock stock:
+        """
+        if self.stock_type is not None and stock.type != self.stock_type:
+            return
+
+        symbol = stock.symbol
+        new_value = getattr(stock, self.method_name)()
+        old_value = self.values.get(symbol)
+
+        if old_value == new_value:
+            return
+
+        if old_value is not None:
+            del self.keys[bisect_left(self.keys, (old_value, symbol))]
+
+        insort(self.keys, (new_value, symbol))
+        self.values[symbol] = new_value
+
+    def symbols(self, start=0, stop=None, descending=False):
+        """
+        Symbols at positions start to stop (exclusive) in the chosen order, like slicing a list.
+
+        :param int start:
+        :param int stop: defaults to the end
+        :param bool descending: largest first
+        :rtype list:
+        """
+        count = len(self.keys)
+        start, stop, _ = slice(start, stop).indices(count)
+
+        if stop <= start:
+            return []
+
+        if descending:
+            return [symbol for _, symbol in reversed(self.keys[count - stop:count - start])]
+
+        return [symbol for _, symbol in self.keys[start:stop]]
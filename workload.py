@@ -0,0 +1,303 @@
+import argparse
+import mmap
+import struct
+import threading
+import time
+from collections import namedtuple
+
+from exchange import ExchangeBuilder, InvalidStockException
+from trade import InvalidTradeException
+
+"""
+    Workload capture and replay.
+
+    Exchange.start_recording writes every public call into a compact binary trace. replay() plays a trace back
+    against a fresh Exchange, either as fast as possible or at the recorded pace, and reports throughput and latency
+    per operation. This lets a new version be benchmarked against real traffic offline.
+
+    Trace format (all little endian):
+
+        header
+            4s  magic, b"SSWT"
+            H   format version
+
+        then one record per call
+            B   operation code, see OPERATIONS
+            d   exchange clock time of the call
+            d   quantity (0 if not applicable)
+            d   price (0 if not applicable)
+            B   length of the stock symbol in bytes (0 if not applicable)
+            ... the stock symbol, utf-8
+            B   length of the client trade ID in bytes (0 if none). Version 2 onwards.
+            ... the trade ID, as a utf-8 string
+
+    Quantities and prices which were whole numbers are replayed as ints.
+
+    Run from the command line with `python workload.py trace.bin [--paced]`.
+"""
+
+MAGIC = b"SSWT"
+FORMAT_VERSION = 2
+READABLE_VERSIONS = (1, 2)
+
+HEADER = struct.Struct("<4sH")
+RECORD = struct.Struct("<BdddB")
+LENGTH = struct.Struct("<B")
+
+# operation code : Exchange method name. Never reuse a code, old traces depend on them.
+OPERATIONS = {
+    1: "get_stock",
+    2: "get_stock_price",
+    3: "buy_stock",
+    4: "sell_stock",
+    5: "calculate_all_share_index",
+}
+OPERATION_CODES = {name: code for code, name in OPERATIONS.items()}
+
+# operations by the arguments they take
+SYMBOL_OPERATIONS = ("get_stock", "get_stock_price")
+TRADE_OPERATIONS = ("buy_stock", "sell_stock")
+
+TraceRecord = namedtuple("TraceRecord", ["operation", "timestamp", "stock_symbol", "quantity", "price", "trade_id"])
+
+
+class InvalidTraceException(Exception):
+    """
+        The file isn't a workload trace, or is from a version we can't read.
+    """
+    pass
+
+
+class TraceRecorder(object):
+    """
+        Appends calls to a trace file. Writes are buffered, so the trace is only complete once close() is called.
+
+        Safe to share between threads. Calls recorded after close() are dropped, as are calls with arguments that
+        can't be written in the trace format (they're counted in skipped), so recording never changes what a call
+        does.
+    """
+
+    def __init__(self, path, buffer_size=1 << 20):
+        """
+        :param str path: file to write to. Overwritten if it exists.
+        :param int buffer_size: bytes to buffer before writing to disk
+        """
+        self.path = path
+        self.file = open(path, "wb", buffering=buffer_size)
+        self.file.write(HEADER.pack(MAGIC, FORMAT_VERSION))
+        self.count = 0
+        self.skipped = 0
+
+        # held for each write and for close, so a call being recorded never meets a closed file
+        self.lock = threading.Lock()
+
+    def record(self, operation, timestamp, stock_symbol="", quantity=0, price=0, trade_id=None):
+        """
+        Append a call to the trace.
+
+        :param str operation: Exchange method name, one of OPERATIONS
+        :param float timestamp: when the call was made
+        :param str stock_symbol:
+        :param quantity:
+        :param price:
+        :param trade_id: client trade ID. Replayed as a string.
+        """
+        symbol = str(stock_symbol).encode("utf-8")[:255]
+        trade_id = b"" if trade_id is None else str(trade_id).encode("utf-8")[:255]
+
+        try:
+            data = RECORD.pack(OPERATION_CODES[operation], timestamp, quantity, price, len(symbol))
+        except (struct.error, OverflowError):  # e.g. a quantity that isn't a number, the call will reject it anyway
+            with self.lock:
+                self.skipped += 1
+            return
+
+        data += symbol + LENGTH.pack(len(trade_id)) + trade_id
+
+        with self.lock:
+            if self.file.closed:
+                return
+
+            self.file.write(data)
+            self.count += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def _restore_number(value):
+    return int(value) if value.is_integer() else value
+
+
+def read_trace(path):
+    """
+    Read a trace back. The file is memory mapped and records are read from it one at a time, so traces of any size
+    can be replayed without loading them into memory.
+
+    :param str path:
+    :return: generator of TraceRecords
+    :raises InvalidTraceException: not a trace, or an unknown version
+    """
+    with open(path, "rb") as f:
+        try:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            raise InvalidTraceException(f"{path} is not a workload trace")
+
+    with data:
+        if len(data) < HEADER.size:
+            raise InvalidTraceException(f"{path} is not a workload trace")
+
+        magic, version = HEADER.unpack_from(data, 0)
+        if magic != MAGIC or version not in READABLE_VERSIONS:
+            raise InvalidTraceException(f"{path} is not a workload trace of a version we can read")
+
+        offset = HEADER.size
+        while offset < len(data):
+            code, timestamp, quantity, price, symbol_length = RECORD.unpack_from(data, offset)
+            offset += RECORD.size
+
+            stock_symbol = data[offset:offset + symbol_length].decode("utf-8")
+            offset += symbol_length
+
+            trade_id = None
+            if version >= 2:
+                trade_id_length = data[offset]
+                offset += LENGTH.size
+
+                if trade_id_length:
+                    trade_id = data[offset:offset + trade_id_length].decode("utf-8")
+                    offset += trade_id_length
+
+            yield TraceRecord(
+                OPERATIONS[code], timestamp, stock_symbol, _restore_number(quantity), _restore_number(price), trade_id
+            )
+
+
+class ReplayClock(object):
+    """
+        Clock handed to the replayed Exchange. Reads as the recorded time of the call being replayed, so trades
+        get the timestamps they were originally made with and pricing windows behave exactly as they did.
+    """
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+class ReplayReport(object):
+    """
+        Throughput and latency results from a replay.
+    """
+
+    def __init__(self):
+        self.latencies = {}  # operation : list of latencies in seconds
+        self.errors = 0
+        self.elapsed = 0.0
+
+    @property
+    def operations(self):
+        return sum(len(x) for x in self.latencies.values())
+
+    @property
+    def throughput(self):
+        """
+        :return: operations per second
+        :rtype float:
+        """
+        return self.operations / self.elapsed if self.elapsed else 0.0
+
+    def percentile(self, operation, percent):
+        """
+        Nearest rank percentile of an operation's latency.
+
+        :param str operation:
+        :param float percent: 0 - 100
+        :return: latency in seconds
+        :rtype float:
+        """
+        latencies = sorted(self.latencies[operation])
+        rank = max(0, min(len(latencies) - 1, int(round(percent / 100 * len(latencies))) - 1))
+        return latencies[rank]
+
+    def __str__(self):
+        lines = [
+            f"{self.operations} operations ({self.errors} rejected) in {self.elapsed:.3f}s, "
+            f"{self.throughput:.0f} ops/s",
+            f"{'operation':<26} {'count':>9} {'p50 us':>9} {'p90 us':>9} {'p99 us':>9} {'max us':>9}",
+        ]
+        for operation in sorted(self.latencies):
+            lines.append(
+                f"{operation:<26} {len(self.latencies[operation]):>9} "
+                + " ".join(f"{self.percentile(operation, x) * 1e6:>9.1f}" for x in (50, 90, 99, 100))
+            )
+
+        return "\n".join(lines)
+
+
+def replay(path, exchange_factory=ExchangeBuilder.build, paced=False):
+    """
+    Re-execute a trace against a fresh exchange.
+
+    Calls that were rejected when recorded (bad stock symbol, invalid or duplicate trade) are rejected again and
+    counted as errors, but still timed.
+
+    :param str path: trace file
+    :param callable exchange_factory: called with a clock, returns the Exchange to replay against
+    :param bool paced: wait between calls to match the recorded timing, rather than going as fast as possible
+    :rtype ReplayReport:
+    """
+    clock = ReplayClock()
+    exchange = exchange_factory(clock=clock)
+    report = ReplayReport()
+
+    perf_counter = time.perf_counter
+    first_timestamp = None
+    started = perf_counter()
+
+    for record in read_trace(path):
+        if first_timestamp is None:
+            first_timestamp = record.timestamp
+
+        if paced:
+            delay = (record.timestamp - first_timestamp) - (perf_counter() - started)
+            if delay > 0:
+                time.sleep(delay)
+
+        clock.now = record.timestamp
+        method = getattr(exchange, record.operation)
+
+        if record.operation in SYMBOL_OPERATIONS:
+            args = (record.stock_symbol,)
+        elif record.operation in TRADE_OPERATIONS:
+            args = (record.stock_symbol, record.quantity, record.price, record.trade_id)
+        else:
+            args = ()
+
+        call_started = perf_counter()
+        try:
+            method(*args)
+        except (InvalidStockException, InvalidTradeException):
+            report.errors += 1
+        latency = perf_counter() - call_started
+
+        report.latencies.setdefault(record.operation, []).append(latency)
+
+    report.elapsed = perf_counter() - started
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded Exchange workload and report its performance.")
+    parser.add_argument("trace", help="trace file written by Exchange.start_recording")
+    parser.add_argument("--paced", action="store_true", help="replay at the recorded pace")
+    args = parser.parse_args()
+
+    print(replay(args.trace, paced=args.paced))
+
+
+if __name__ == '__main__':
+    main()